@@ -0,0 +1,231 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Optional, Tuple
+from urllib.parse import urljoin
+import aiohttp
+from classify.planner import estimate_tokens
+
+
+class TokenRateLimiter:
+    """
+    Sliding one-minute window over the estimated tokens of sent requests.
+    Waiting happens outside the lock, so a request that does not fit yet
+    never holds up smaller ones that do.
+    """
+
+    WINDOW = 60.0
+
+    def __init__(self, tokens_per_minute: Optional[int] = None):
+        self.tokens_per_minute = tokens_per_minute
+        self.sent: Deque[Tuple[float, int]] = deque()
+        self.used = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        if not self.tokens_per_minute:
+            return
+        while True:
+            async with self.lock:
+                now = time.monotonic()
+                while self.sent and now - self.sent[0][0] >= self.WINDOW:
+                    self.used -= self.sent.popleft()[1]
+                # a request over the whole budget is sent alone
+                if not self.sent or self.used + tokens <= self.tokens_per_minute:
+                    self.sent.append((now, tokens))
+                    self.used += tokens
+                    return
+                wait = self.sent[0][0] + self.WINDOW - now
+            await asyncio.sleep(wait)
+
+
+class AsyncChatClient:
+    """
+    Chat completions over one pooled aiohttp session: at most `concurrency`
+    requests in flight, an optional tokens-per-minute budget, a timeout per
+    attempt and exponential backoff on 429, 5xx and connection errors.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        api_key: str,
+        api_url: str,
+        concurrency: int = 8,
+        tokens_per_minute: Optional[int] = None,
+        timeout: float = 120,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "AsyncChatClient":
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            },
+        )
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.limiter = TokenRateLimiter(self.tokens_per_minute)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    @staticmethod
+    def estimate_tokens(content: dict) -> int:
+        # prompt estimate plus the whole answer budget
+        return sum(
+            estimate_tokens(message["content"]) for message in content["messages"]
+        ) + content.get("max_tokens", 0)
+
+    def retry_delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        delay = min(self.backoff * 2**attempt, self.max_backoff)
+        # jitter so throttled requests do not come back together
+        return delay * random.uniform(0.5, 1.0)
+
+    async def complete(self, content: dict) -> Optional[dict]:
+        url = urljoin(self.api_url, "/chat/completions")
+        tokens = self.estimate_tokens(content)
+        for attempt in range(self.max_retries + 1):
+            # a request waiting for budget or backing off holds no slot
+            await self.limiter.acquire(tokens)
+            retry_after = None
+            async with self.semaphore:
+                try:
+                    async with self.session.post(url, json=content) as response:
+                        if response.status == 200:
+                            return json.loads(await response.text())
+                        error = f"{response.status} - {await response.text()}"
+                        if response.status not in self.RETRY_STATUSES:
+                            print(f"Error: {error}")
+                            return None
+                        retry_after = response.headers.get("Retry-After")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = repr(e)
+            if attempt == self.max_retries:
+                break
+            delay = self.retry_delay(attempt, retry_after)
+            print(f"Retrying in {delay:.1f}s after {error}")
+            await asyncio.sleep(delay)
+        print(f"Error: giving up after {self.max_retries + 1} attempts: {error}")
+        return None
+
+
+class ClassifierPool:
+    """
+    Runs LLMClassifier.classify_all_async on an event loop in a background
+    thread, so the ingest loop keeps parsing while requests are in flight.
+    submit() returns a Future resolving to the classified question list,
+    submit_many() one resolving to classify_many's list of papers.
+    """
+
+    def __init__(self, classifier, **client_options):
+        self.classifier = classifier
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.client = AsyncChatClient(
+            classifier.api_key, classifier.api_url, **client_options
+        )
+        self.run(self.client.__aenter__()).result()
+
+    def run(self, coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def submit(self, questions: list) -> Future:
+        return self.run(self.classifier.classify_all_async(self.client, questions))
+
+    def submit_many(self, papers: list) -> Future:
+        return self.run(self.classifier.classify_many_async(self.client, papers))
+
+    def close(self):
+        self.run(self.client.__aexit__(None, None, None)).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self) -> "ClassifierPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import copy
+    from classify.classify_llm import LLMClassifier
+    from classify.stub_server import start_stub_server
+    from parser.models.question import MultipleChoiceQuestion
+    from parser.models.syllabus import Syllabus
+
+    # sequential vs pooled classification against the local stub server:
+    #   python -m classify.async_client --papers 40 --latency 0.2
+    arg_parser = argparse.ArgumentParser(description="Benchmark the async client")
+    arg_parser.add_argument("--papers", type=int, default=40)
+    arg_parser.add_argument("--latency", type=float, default=0.2)
+    arg_parser.add_argument("--fail-rate", type=float, default=0.1)
+    arg_parser.add_argument("--concurrency", type=int, default=8)
+    args = arg_parser.parse_args()
+
+    syllabuses = [
+        Syllabus(number=f"{i}.{j}", title=f"{i}.{j} Topic", content=["point"])
+        for i in range(1, 6)
+        for j in range(1, 4)
+    ]
+    papers = [
+        [
+            MultipleChoiceQuestion(
+                number=n, text=f"Paper {p} question {n}", options=["A a", "B b"]
+            )
+            for n in range(1, 41)
+        ]
+        for p in range(args.papers)
+    ]
+    server = start_stub_server(latency=args.latency)
+    api_url = f"http://127.0.0.1:{server.server_port}"
+    classifier = LLMClassifier("stub", api_url, syllabuses)
+
+    start = time.perf_counter()
+    expected = [classifier.classify_all(copy.deepcopy(paper)) for paper in papers]
+    sequential = time.perf_counter() - start
+
+    server.fail_rate = args.fail_rate
+    start = time.perf_counter()
+    with ClassifierPool(classifier, concurrency=args.concurrency, backoff=0.05) as pool:
+        futures = [pool.submit(copy.deepcopy(paper)) for paper in papers]
+        results = [future.result() for future in futures]
+    pooled = time.perf_counter() - start
+    server.shutdown()
+
+    def tags(questions: list) -> list:
+        return [[syl.number for syl in q.syllabus] for q in questions]
+
+    same = all(tags(a) == tags(b) for a, b in zip(expected, results))
+    print(f"{'same' if same else 'DIFFERENT'} tags on {len(papers)} papers")
+    print(f"sequential: {sequential:.2f}s, pooled: {pooled:.2f}s")
+    print(f"speedup: {sequential / pooled:.1f}x")
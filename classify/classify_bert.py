@@ -6,16 +6,18 @@ from parser.models.question import (
 )
 from parser.models.syllabus import Syllabus
 
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import re
-import tqdm
 import pickle
 import os
 import numpy as np
-from collections import Counter
+
+Node = Question | SubQuestion | SubSubQuestion | MultipleChoiceQuestion
 
 
 class BERTClassifier:
+    TOP_K = 10
+    THRESHOLD = 0.3
 
     def __init__(
         self,
@@ -24,7 +26,7 @@ class BERTClassifier:
         cache_path: str = "syllabus_embeddings.pkl",
         model_name: str = "allenai/scibert_scivocab_uncased",
     ):
-        from sentence_transformers import SentenceTransformer, util
+        from sentence_transformers import SentenceTransformer
 
         self.batch_size = batch_size
         self.cache_path = cache_path
@@ -40,6 +42,7 @@ class BERTClassifier:
             print("Processing syllabus content...")
             self._preprocess_syllabuses(syllabuses)
             self._save_cache()
+        self._prepare_corpus()
 
     def _preprocess_syllabuses(self, syllabuses: List[Syllabus]) -> None:
         # Create corpus and mapping
@@ -60,6 +63,13 @@ class BERTClassifier:
             convert_to_numpy=True,
         )
 
+    def _prepare_corpus(self) -> None:
+        # unit rows, so one matrix product gives the cosine similarities
+        embeddings = np.asarray(self.corpus_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        self.corpus_normalized = embeddings / np.maximum(norms, 1e-12)
+        self.corpus_syllabus = np.asarray(self.syllabus_mapping, dtype=np.int64)
+
     def _save_cache(self) -> None:
         cache_data = {
             "corpus": self.corpus,
@@ -85,55 +95,92 @@ class BERTClassifier:
     def classify_all(
         self, questions: List[Question | MultipleChoiceQuestion]
     ) -> List[Question | MultipleChoiceQuestion]:
-        for question in tqdm.tqdm(questions, desc="Classifying questions"):
-            self.classify(question)
-        return questions
+        return self.classify_many([questions])[0]
+
+    def classify_many(
+        self, papers: List[List[Question | MultipleChoiceQuestion]]
+    ) -> List[List[Question | MultipleChoiceQuestion]]:
+        # every node of every paper is encoded and scored in one batch
+        nodes: List[Tuple[Node, str]] = []
+        for questions in papers:
+            for question in questions:
+                self.collect(question, nodes)
+        syllabuses = self.best_syllabuses([text for _, text in nodes])
+        for (node, _), syllabus in zip(nodes, syllabuses):
+            node.syllabus = syllabus
+        return papers
 
     def classify(
         self, question: MultipleChoiceQuestion | Question | SubQuestion | SubSubQuestion
     ) -> None:
+        self.classify_many([[question]])
+
+    def collect(self, question: Node, nodes: List[Tuple[Node, str]]) -> None:
+        # (node, text) pairs, children before their parent
         if isinstance(question, MultipleChoiceQuestion):
-            question.syllabus = self.get_best_syllabus(question.text)
+            nodes.append((question, question.text))
             return
         elif isinstance(question, SubQuestion):
             if question.subsubquestions:
                 for subsubquestion in question.subsubquestions:
-                    self.classify(subsubquestion)
+                    self.collect(subsubquestion, nodes)
         elif isinstance(question, Question):
             if question.subquestions:
                 for subquestion in question.subquestions:
-                    self.classify(subquestion)
+                    self.collect(subquestion, nodes)
 
         # Combine question text and answer for better matching
         question_text = (
             question.text + " " + (question.answer if question.answer else "")
         )
-        question.syllabus = self.get_best_syllabus(question_text)
+        nodes.append((question, question_text))
 
-    def get_best_syllabus(self, question_sentence: str, threshold=0.3) -> Syllabus:
+    @staticmethod
+    def clean(question_sentence: str) -> str:
         # Clean text: remove more than three connected dots and score markers
         question_sentence = re.sub(r"\.{3,}", "", question_sentence)
         question_sentence = re.sub(r"\[\d+\]", "", question_sentence)
         question_sentence = re.sub(r"\(\w{1,3}\)", "", question_sentence)
-
-        # Get embedding for the question
-        question_embedding = self.model.encode(question_sentence, convert_to_numpy=True)
-
-        similarities = util.semantic_search(
-            question_embedding,
-            self.corpus_embeddings,
-            top_k=10,
-            score_function=util.cos_sim,
+        return question_sentence
+
+    def get_best_syllabus(
+        self, question_sentence: str, threshold=THRESHOLD
+    ) -> Syllabus:
+        return self.best_syllabuses([question_sentence], threshold)[0]
+
+    def best_syllabuses(
+        self, question_sentences: List[str], threshold: float = THRESHOLD
+    ) -> List[Syllabus]:
+        if not question_sentences:
+            return []
+        embeddings = self.model.encode(
+            [self.clean(sentence) for sentence in question_sentences],
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+        ).astype(np.float32)
+        embeddings /= np.maximum(
+            np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12
         )
-
-        weighted_similarities = Counter()
-        for hit in filter(lambda x: x["score"] > threshold, similarities[0]):
-            syllabus_idx = self.syllabus_mapping[hit["corpus_id"]]
-            weighted_similarities[syllabus_idx] += hit["score"]
-
-        if not weighted_similarities:
-            return Syllabus("0", "unknown")
-        return self.syllabus_objects[weighted_similarities.most_common(1)[0][0]]
+        similarities = embeddings @ self.corpus_normalized.T
+
+        # top-k corpus points per question, then a score-weighted vote of
+        # their syllabuses over the points above the threshold
+        k = min(self.TOP_K, similarities.shape[1])
+        if k == 0:
+            return [Syllabus("0", "unknown") for _ in question_sentences]
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        kept = top_scores > threshold
+        rows = np.broadcast_to(np.arange(len(top))[:, None], top.shape)
+        votes = np.zeros((len(top), len(self.syllabus_objects)), dtype=np.float32)
+        np.add.at(
+            votes, (rows[kept], self.corpus_syllabus[top[kept]]), top_scores[kept]
+        )
+        best = votes.argmax(axis=1)
+        return [
+            self.syllabus_objects[index] if found else Syllabus("0", "unknown")
+            for index, found in zip(best, kept.any(axis=1))
+        ]
 
 
 if __name__ == "__main__":
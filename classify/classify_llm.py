@@ -8,14 +8,19 @@ from parser.models.question import (
 
 load_dotenv()
 from parser.models.syllabus import Syllabus
+from parser.models.question_tree import QuestionTree
+from classify.response_cache import ResponseCache
+from classify.planner import Part, RequestPlanner
+from classify.retrieval import SyllabusRetriever
 from parser.sq_ms_parser import SQMSParser
 from parser.sq_parser import QuestionPaperParser
 from parser.mcq_ms_parser import MCQMSParser
 from parser.mcq_parser import MCQParser
 from parser.syllabus_parser import SyllabusParser
 import pdfplumber
-from typing import List, Optional
+from typing import Dict, List, Optional
 from urllib.parse import urljoin
+import asyncio
 import re
 import tqdm
 import os
@@ -24,39 +29,118 @@ import requests
 
 
 class LLMClassifier:
+    MODEL = "deepseek-chat"
+    MAX_TOKENS = 2000
     GUIDE = """
     你是一个考试大纲分类器, 你需要把考试问题分类到考试大纲中. 你有一个考试大纲和一组考试问题. 考试问题可能是多层嵌套的, 你需要把每个最小问题都分类到考试大纲中. 你只需要分类最小的问题单位(带Answer:), 不需要分类父问题.
     输入格式为Number:{question_number} Text:{question_description}( Answer:{question_answer}) 输出格式为{question_number(如果有父问题, 组合number, 用空格连接)}:{syllabus_number},每个question占一行, 不需要输出多余信息.
     """
+    # sent with requests that pack several papers, whose question numbers
+    # carry a P<k>- prefix
+    PACKED_GUIDE = (
+        "题号带有试卷前缀(如 P1-4, P2-4), 输出时保留前缀, 例如 P2-4 a i:12.3."
+    )
+    PACKED_PREFIX = re.compile(r"^P(\d+)-(.+)$")
 
     def __init__(
         self,
         api_key: str,
         api_url: str,
         syllabuses: List[Syllabus],
+        model: str = MODEL,
+        response_cache: Optional[ResponseCache] = None,
+        planner: Optional[RequestPlanner] = None,
+        retriever: Optional[SyllabusRetriever] = None,
     ):
         self.syllabus = syllabuses
+        self.syllabus_index: Dict[str, Syllabus] = {}
+        for syllabus in syllabuses:
+            # the first item wins on duplicate numbers, as next() scans did
+            self.syllabus_index.setdefault(syllabus.number, syllabus)
         self.syllabus_str = "\n\n".join([str(syl) for syl in syllabuses]) + "\n\n"
         self.api_key = api_key
         self.api_url = api_url
+        self.model = model
+        self.response_cache = response_cache
+        self.planner = planner or RequestPlanner(self.format_questions)
+        # narrows the syllabus sent with each request, None sends all of it
+        self.retriever = retriever
 
     def classify_all(
         self, questions: List[Question | MultipleChoiceQuestion]
     ) -> List[Question | MultipleChoiceQuestion]:
-        if isinstance(questions[0], MultipleChoiceQuestion):
-            text = self.format_mcq(questions)
-        else:
-            text = self.format_structured_question(questions)
+        return self.assign_answer(
+            questions, self.complete(self.build_request(questions))
+        )
+
+    def classify_many(
+        self, papers: List[List[Question | MultipleChoiceQuestion]]
+    ) -> List[Optional[List[Question | MultipleChoiceQuestion]]]:
+        # planned requests: oversized papers split, small ones packed; a
+        # paper is None if any of its requests failed
+        trees = [QuestionTree(questions) for questions in papers]
+        failed = set()
+        for parts in self.planner.plan(papers):
+            result = self.complete(self.build_packed_request(parts))
+            if not self.assign_parts(parts, trees, result):
+                failed.update(paper_index for paper_index, _ in parts)
+        return [
+            None if i in failed else questions for i, questions in enumerate(papers)
+        ]
+
+    def build_request(self, questions: List[Question | MultipleChoiceQuestion]) -> dict:
+        # chat completion request body for one paper
+        return self.request_body(
+            self.format_questions(questions),
+            syllabus_str=self.syllabus_for([questions]),
+        )
+
+    def build_packed_request(self, parts: List[Part]) -> dict:
+        # a single part is sent exactly like build_request, so it shares its
+        # cache entries
+        if len(parts) == 1:
+            return self.build_request(parts[0][1])
+        text = "\n\n".join(
+            self.format_questions(questions, prefix=f"P{k}-")
+            for k, (_, questions) in enumerate(parts, 1)
+        )
+        return self.request_body(
+            text,
+            guide=self.GUIDE + self.PACKED_GUIDE,
+            syllabus_str=self.syllabus_for([questions for _, questions in parts]),
+        )
+
+    def syllabus_for(
+        self, papers: List[List[Question | MultipleChoiceQuestion]]
+    ) -> str:
+        # the retriever's candidates for all questions of a request, or the
+        # full syllabus when it has none
+        if self.retriever is None:
+            return self.syllabus_str
+        candidates = self.retriever.candidates(
+            [
+                text
+                for questions in papers
+                for text in self.retriever.question_texts(questions)
+            ]
+        )
+        if candidates is None:
+            return self.syllabus_str
+        return "\n\n".join([str(syl) for syl in candidates]) + "\n\n"
+
+    def request_body(
+        self, text: str, guide: Optional[str] = None, syllabus_str: Optional[str] = None
+    ) -> dict:
         content = {
-            "model": "deepseek-chat",
+            "model": self.model,
             "messages": [
                 {
                     "role": "system",
-                    "content": self.GUIDE,
+                    "content": guide or self.GUIDE,
                 },
                 {
                     "role": "user",
-                    "content": f"{self.syllabus_str}",
+                    "content": f"{syllabus_str or self.syllabus_str}",
                 },
                 {
                     "role": "user",
@@ -82,9 +166,74 @@ class LLMClassifier:
                 },
             ],
             "temperature": 0,
-            "max_tokens": 2000,
+            "max_tokens": self.MAX_TOKENS,
             "stream": False,
         }
+        return content
+
+    def assign_answer(
+        self,
+        questions: List[Question | MultipleChoiceQuestion],
+        result: Optional[dict],
+    ) -> List[Question | MultipleChoiceQuestion]:
+        # tag questions from the "number:syllabus" lines of a response
+        if self.assign_parts([(0, questions)], [QuestionTree(questions)], result):
+            return questions
+
+    def assign_parts(
+        self, parts: List[Part], trees: List[QuestionTree], result: Optional[dict]
+    ) -> bool:
+        # tag the papers of one request, trees are indexed by paper index
+        if result is None:
+            return False
+        if not ("choices" in result and len(result["choices"]) > 0):
+            print(f"Error: {result}")
+            return False
+        choice = result["choices"][0]
+        if choice.get("finish_reason") == "length":
+            print("Error: answer truncated at max_tokens")
+        answer = choice["message"]["content"]
+        print(answer)
+        lines = answer.strip().split("\n")
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            line_parts = line.split(":")
+            if len(line_parts) != 2:
+                print(f"Error: {line}")
+                continue
+            question_number, syllabus_number = line_parts
+            question_number = question_number.strip()
+            syllabus_number = syllabus_number.strip()
+            tree = trees[parts[0][0]]
+            if len(parts) > 1:
+                # packed request: P<k>- names the part
+                match = self.PACKED_PREFIX.match(question_number)
+                if not match or not 1 <= int(match.group(1)) <= len(parts):
+                    print(f"Error: {question_number} has no paper prefix")
+                    continue
+                tree = trees[parts[int(match.group(1)) - 1][0]]
+                question_number = match.group(2)
+            question_number_list = question_number.split(" ")
+            syllabus = self.find_syllabus(syllabus_number)
+            if not syllabus:
+                print(f"Error: {syllabus_number} not found in syllabus")
+                continue
+            if not tree.tag_syllabus(
+                syllabus,
+                int(question_number_list[0]),
+                (question_number_list[1] if len(question_number_list) > 1 else None),
+                (question_number_list[2] if len(question_number_list) > 2 else None),
+            ):
+                print(f"Error: {question_number} not found in questions")
+        return True
+
+    def complete(self, content: dict) -> Optional[dict]:
+        # raw chat completion response, from the cache when it has one
+        result = self.cached_response(content)
+        if result is not None:
+            return result
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -92,64 +241,81 @@ class LLMClassifier:
         response = requests.post(
             urljoin(self.api_url, "/chat/completions"), headers=headers, json=content
         )
-        if response.status_code == 200:
-            result = response.json()
-            if "choices" in result and len(result["choices"]) > 0:
-                answer = result["choices"][0]["message"]["content"]
-                print(answer)
-                lines = answer.strip().split("\n")
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    parts = line.split(":")
-                    if len(parts) != 2:
-                        print(f"Error: {line}")
-                        continue
-                    question_number, syllabus_number = parts
-                    question_number = question_number.strip()
-                    syllabus_number = syllabus_number.strip()
-                    question_number_list = question_number.split(" ")
-                    syllabus = self.find_syllabus(syllabus_number)
-                    if not syllabus:
-                        print(f"Error: {syllabus_number} not found in syllabus")
-                        continue
-                    if not self.assign_to_question(
-                        syllabus,
-                        questions,
-                        int(question_number_list[0]),
-                        (
-                            question_number_list[1]
-                            if len(question_number_list) > 1
-                            else None
-                        ),
-                        (
-                            question_number_list[2]
-                            if len(question_number_list) > 2
-                            else None
-                        ),
-                    ):
-                        print(f"Error: {question_number} not found in questions")
-                return questions
-            else:
-                print(f"Error: {result}")
-        else:
+        if response.status_code != 200:
             print(f"Error: {response.status_code} - {response.text}")
+            return None
+        result = response.json()
+        self.cache_response(content, result)
+        return result
+
+    async def complete_async(self, client, content: dict) -> Optional[dict]:
+        # same as complete, over a shared classify.async_client.AsyncChatClient
+        result = self.cached_response(content)
+        if result is not None:
+            return result
+        result = await client.complete(content)
+        if result is not None:
+            self.cache_response(content, result)
+        return result
+
+    async def classify_all_async(
+        self, client, questions: List[Question | MultipleChoiceQuestion]
+    ) -> List[Question | MultipleChoiceQuestion]:
+        return self.assign_answer(
+            questions, await self.complete_async(client, self.build_request(questions))
+        )
+
+    async def classify_many_async(
+        self, client, papers: List[List[Question | MultipleChoiceQuestion]]
+    ) -> List[Optional[List[Question | MultipleChoiceQuestion]]]:
+        # classify_many with the planned requests sent concurrently
+        trees = [QuestionTree(questions) for questions in papers]
+        plan = self.planner.plan(papers)
+        results = await asyncio.gather(
+            *(
+                self.complete_async(client, self.build_packed_request(parts))
+                for parts in plan
+            )
+        )
+        failed = set()
+        for parts, result in zip(plan, results):
+            if not self.assign_parts(parts, trees, result):
+                failed.update(paper_index for paper_index, _ in parts)
+        return [
+            None if i in failed else questions for i, questions in enumerate(papers)
+        ]
+
+    def cached_response(self, content: dict) -> Optional[dict]:
+        if self.response_cache is None:
+            return None
+        result = self.response_cache.load(content)
+        if result is None and self.response_cache.replay:
+            raise RuntimeError("No cached LLM response in replay mode")
+        return result
+
+    def cache_response(self, content: dict, result: dict):
+        if self.response_cache is not None and result.get("choices"):
+            self.response_cache.store(content, result)
 
     def find_syllabus(self, syllabus_number: str) -> Optional[Syllabus]:
-        for syllabus in self.syllabus:
-            if syllabus.number == syllabus_number:
-                return syllabus
-        return None
+        return self.syllabus_index.get(syllabus_number)
+
+    @classmethod
+    def format_questions(
+        cls, questions: List[Question | MultipleChoiceQuestion], prefix: str = ""
+    ) -> str:
+        if isinstance(questions[0], MultipleChoiceQuestion):
+            return cls.format_mcq(questions, prefix)
+        return cls.format_structured_question(questions, prefix)
 
     @staticmethod
-    def format_structured_question(questions: List[Question]) -> str:
+    def format_structured_question(questions: List[Question], prefix: str = "") -> str:
         output = ""
         sub = lambda s: re.sub(
             r"\.{3,}", "", re.sub(r"\[(\d+|(Total: \d+))\]", "", s)
         ).strip()
         for q in questions:
-            output += f"Number:{q.number} Text:{sub(q.text)}"
+            output += f"Number:{prefix}{q.number} Text:{sub(q.text)}"
             if q.subquestions:
                 output += "\n"
                 for sub_q in q.subquestions:
@@ -168,10 +334,10 @@ class LLMClassifier:
         return output
 
     @staticmethod
-    def format_mcq(questions: List[MultipleChoiceQuestion]) -> str:
+    def format_mcq(questions: List[MultipleChoiceQuestion], prefix: str = "") -> str:
         output = ""
         for q in questions:
-            output += f"Number:{q.number} Text:{q.text}"
+            output += f"Number:{prefix}{q.number} Text:{q.text}"
             if q.options:
                 output += f" Options: {', '.join(q.options)}"
             if q.answer:
@@ -179,61 +345,6 @@ class LLMClassifier:
             output += "\n\n"
         return output.strip()
 
-    def assign_to_question(
-        self,
-        syllabus: Syllabus,
-        questions: List[Question] | List[MultipleChoiceQuestion],
-        question_number: int,
-        subquestion_number: Optional[str] = None,
-        subsubquestion_number: Optional[str] = None,
-    ) -> bool:
-        # Find matching question
-        matching_question = next(
-            filter(lambda q: q.number == question_number, questions), None
-        )
-        if not matching_question:
-            return False
-
-        # If no subquestion, assign directly to question
-        if not subquestion_number or not matching_question.subquestions:
-            matching_question.syllabus = [syllabus]
-            return True
-
-        # Find matching subquestion
-        matching_subquestion = next(
-            (
-                filter(
-                    lambda sq: sq.number == subquestion_number,
-                    matching_question.subquestions,
-                )
-            ),
-            None,
-        )
-        if not matching_subquestion:
-            return False
-
-        # If no subsubquestion, assign to subquestion
-        if not subsubquestion_number or not matching_subquestion.subsubquestions:
-            matching_subquestion.syllabus = [syllabus]
-            matching_question.syllabus.append(syllabus)
-            return True
-
-        # Find and assign to matching subsubquestion
-        matching_subsubquestion = next(
-            (
-                ssq
-                for ssq in matching_subquestion.subsubquestions
-                if ssq.number == subsubquestion_number
-            ),
-            None,
-        )
-        if matching_subsubquestion:
-            matching_subsubquestion.syllabus = [syllabus]
-            matching_subquestion.syllabus.append(syllabus)
-            matching_question.syllabus.append(syllabus)
-            return True
-        return False
-
 
 if __name__ == "__main__":
     issq = input("Test SQ? (y/n): ").strip().lower() == "y"
@@ -0,0 +1,91 @@
+from typing import Callable, List, Tuple
+from parser.models.question import Question, MultipleChoiceQuestion
+
+# rough, the guide is Chinese and the questions English
+CHARS_PER_TOKEN = 3
+
+# (paper index, consecutive top-level questions of that paper)
+Part = Tuple[int, List[Question | MultipleChoiceQuestion]]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class RequestPlanner:
+    """
+    Groups the questions of several papers into chat requests that fit a
+    prompt and an answer token budget. A paper over budget is split between
+    top-level questions; small papers are packed together, and the request
+    tells them apart by a paper prefix on the question numbers.
+    """
+
+    # one "4 a ii:12.3" line
+    ANSWER_TOKENS_PER_LINE = 12
+    MAX_PROMPT_TOKENS = 16000
+    MAX_ANSWER_TOKENS = 1500
+
+    def __init__(
+        self,
+        format_questions: Callable[[list], str],
+        max_prompt_tokens: int = MAX_PROMPT_TOKENS,
+        max_answer_tokens: int = MAX_ANSWER_TOKENS,
+    ):
+        # format_questions renders questions the way the request sends them
+        self.format_questions = format_questions
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_answer_tokens = max_answer_tokens
+
+    @staticmethod
+    def answer_lines(question: Question | MultipleChoiceQuestion) -> int:
+        # one output line per innermost question
+        subquestions = getattr(question, "subquestions", None)
+        if not subquestions:
+            return 1
+        return sum(len(sub.subsubquestions) or 1 for sub in subquestions)
+
+    def estimate(self, question: Question | MultipleChoiceQuestion) -> Tuple[int, int]:
+        # (prompt tokens, answer tokens) of one top-level question
+        return (
+            estimate_tokens(self.format_questions([question])),
+            self.answer_lines(question) * self.ANSWER_TOKENS_PER_LINE,
+        )
+
+    def split(self, paper_index: int, questions: list) -> List[Tuple[Part, int, int]]:
+        # (part, prompt tokens, answer tokens), each part within budget unless
+        # a single question is over it alone
+        parts = []
+        current, prompt, answer = [], 0, 0
+        for question in questions:
+            question_prompt, question_answer = self.estimate(question)
+            if current and (
+                prompt + question_prompt > self.max_prompt_tokens
+                or answer + question_answer > self.max_answer_tokens
+            ):
+                parts.append(((paper_index, current), prompt, answer))
+                current, prompt, answer = [], 0, 0
+            current.append(question)
+            prompt += question_prompt
+            answer += question_answer
+        if current:
+            parts.append(((paper_index, current), prompt, answer))
+        return parts
+
+    def plan(self, papers: List[list]) -> List[List[Part]]:
+        # requests in paper order, each a list of parts
+        requests = []
+        current, prompt, answer = [], 0, 0
+        for paper_index, questions in enumerate(papers):
+            for part, part_prompt, part_answer in self.split(paper_index, questions):
+                if current and (
+                    prompt + part_prompt > self.max_prompt_tokens
+                    or answer + part_answer > self.max_answer_tokens
+                ):
+                    requests.append(current)
+                    current, prompt, answer = [], 0, 0
+                current.append(part)
+                prompt += part_prompt
+                answer += part_answer
+        if current:
+            requests.append(current)
+        return requests
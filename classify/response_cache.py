@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+from typing import Optional
+
+
+class ResponseCache:
+    """
+    On-disk cache of raw chat completion responses, keyed by the SHA-256 of
+    the request body (model, guide, syllabus, examples and the formatted
+    questions). Requests are sent at temperature 0, so a hit is what the API
+    would answer again.
+    """
+
+    CACHE_DIR = "cache/llm"
+    # "on": read and write, "replay": read only and never call the API,
+    # "off": always call the API
+    MODES = ("on", "replay", "off")
+
+    def __init__(self, cache_dir: str = CACHE_DIR, mode: str = "on"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown response cache mode: {mode}")
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def key(content: dict) -> str:
+        body = json.dumps(content, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        # two-level layout keeps directories small on a full archive
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def load(self, content: dict) -> Optional[dict]:
+        if self.mode == "off":
+            return None
+        key = self.key(content)
+        path = self.entry_path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                response = json.load(f)["response"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"LLM cache entry {key} unreadable: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return response
+
+    def store(self, content: dict, response: dict):
+        if self.mode != "on":
+            return
+        key = self.key(content)
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"model": content.get("model"), "response": response},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, path)
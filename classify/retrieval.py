@@ -0,0 +1,213 @@
+import re
+import numpy as np
+from typing import Dict, List, Optional
+from parser.models.question import Question, MultipleChoiceQuestion
+from parser.models.syllabus import Syllabus
+
+
+class SyllabusRetriever:
+    """
+    TF-IDF ranking of syllabus items (title + content points) against
+    question text, so a classification prompt can carry only the candidate
+    items instead of the whole syllabus.
+    """
+
+    # the smallest k that kept every labelled item of a structured paper
+    TOP_K = 4
+    # a question whose best item scores below MIN_SCORE gets its top WIDE_K
+    # items instead of its top k
+    MIN_SCORE = 0.08
+    WIDE_K = 24
+    TOKEN = re.compile(r"[a-z]+")
+    STOP_WORDS = frozenset(
+        "the and for are but not you all any can her was one our out has his how "
+        "its may new now see two who did get let put say she too use with that "
+        "this from they will what when which their there them then than these "
+        "those into each some such been were have more most other about also "
+        "only over both your show state give name describe explain suggest "
+        "using used between including answer text number".split()
+    )
+
+    def __init__(
+        self,
+        syllabuses: List[Syllabus],
+        top_k: int = TOP_K,
+        min_score: float = MIN_SCORE,
+        wide_k: int = WIDE_K,
+    ):
+        self.syllabuses = syllabuses
+        self.top_k = min(top_k, len(syllabuses))
+        self.min_score = min_score
+        self.wide_k = min(max(wide_k, top_k), len(syllabuses))
+        documents = [
+            self.tokens(" ".join([syllabus.title, *syllabus.content]))
+            for syllabus in syllabuses
+        ]
+        self.vocabulary: Dict[str, int] = {}
+        for document in documents:
+            for token in document:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+        counts = self.term_counts(documents)
+        document_frequency = np.count_nonzero(counts, axis=0)
+        self.idf = (np.log((1 + len(documents)) / (1 + document_frequency)) + 1).astype(
+            np.float32
+        )
+        self.matrix = self.weigh(counts)
+
+    @classmethod
+    def tokens(cls, text: str) -> List[str]:
+        tokens = []
+        for token in cls.TOKEN.findall(text.lower()):
+            if len(token) < 3 or token in cls.STOP_WORDS:
+                continue
+            # crude plural folding: enzymes -> enzyme, cells -> cell
+            if token.endswith("s") and not token.endswith("ss") and len(token) > 3:
+                token = token[:-1]
+            tokens.append(token)
+        return tokens
+
+    def term_counts(self, documents: List[List[str]]) -> np.ndarray:
+        counts = np.zeros((len(documents), len(self.vocabulary)), np.float32)
+        for row, document in enumerate(documents):
+            columns = [self.vocabulary[t] for t in document if t in self.vocabulary]
+            np.add.at(counts[row], columns, 1)
+        return counts
+
+    def weigh(self, counts: np.ndarray) -> np.ndarray:
+        # sublinear tf * idf, rows L2-normalized so dot products are cosines
+        weights = np.zeros_like(counts)
+        np.log1p(counts, out=weights, where=counts > 0)
+        weights *= self.idf
+        norms = np.linalg.norm(weights, axis=1, keepdims=True)
+        return weights / np.maximum(norms, 1e-12)
+
+    def scores(self, texts: List[str]) -> np.ndarray:
+        # (texts, syllabus items) cosine similarities
+        vectors = self.weigh(self.term_counts([self.tokens(text) for text in texts]))
+        return vectors @ self.matrix.T
+
+    @staticmethod
+    def question_texts(questions: List[Question | MultipleChoiceQuestion]) -> List[str]:
+        # one text per innermost question, with its parents' text as context
+        texts = []
+        for q in questions:
+            if isinstance(q, MultipleChoiceQuestion):
+                texts.append(" ".join([q.text, *(q.options or []), q.answer or ""]))
+                continue
+            if not q.subquestions:
+                texts.append(f"{q.text} {q.answer or ''}")
+                continue
+            for sub_q in q.subquestions:
+                if not sub_q.subsubquestions:
+                    texts.append(f"{q.text} {sub_q.text} {sub_q.answer or ''}")
+                    continue
+                for subsub_q in sub_q.subsubquestions:
+                    texts.append(
+                        f"{q.text} {sub_q.text} {subsub_q.text} {subsub_q.answer or ''}"
+                    )
+        return texts
+
+    def candidates(self, texts: List[str]) -> Optional[List[Syllabus]]:
+        # union of every text's top-k items in syllabus order; a text that
+        # matches weakly adds its top wide_k items. None (send the full
+        # syllabus) if any text shares no word with the syllabus, as nothing
+        # ranks its items
+        if not texts or self.top_k == 0:
+            return None
+        scores = self.scores(texts)
+        best = scores.max(axis=1)
+        if not best.all():
+            return None
+        keep = np.zeros(len(self.syllabuses), np.bool_)
+        for k, rows in (
+            (self.top_k, best >= self.min_score),
+            (self.wide_k, best < self.min_score),
+        ):
+            if rows.any():
+                top = np.argpartition(-scores[rows], k - 1, axis=1)[:, :k]
+                keep[top.ravel()] = True
+        return [self.syllabuses[i] for i in np.flatnonzero(keep)]
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from collections import defaultdict
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    # recall on questions already classified against the full syllabus:
+    #   python -m classify.retrieval igcse-biology-0610 --top-k 4 --pack 1
+    arg_parser = argparse.ArgumentParser(description="Evaluate syllabus retrieval")
+    arg_parser.add_argument("subject", help="database with classified questions")
+    arg_parser.add_argument("--top-k", type=int, default=SyllabusRetriever.TOP_K)
+    arg_parser.add_argument(
+        "--min-score", type=float, default=SyllabusRetriever.MIN_SCORE
+    )
+    arg_parser.add_argument("--wide-k", type=int, default=SyllabusRetriever.WIDE_K)
+    # papers per request, as LLM_PACK plans them
+    arg_parser.add_argument("--pack", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    load_dotenv()
+    database = MongoClient(os.getenv("MONGO_URI"))[args.subject]
+    syllabus_docs = list(database["syllabus"].find())
+    syllabuses = [
+        Syllabus(number=doc["number"], title=doc["title"], content=doc["content"])
+        for doc in syllabus_docs
+    ]
+    numbers = {doc["_id"]: doc["number"] for doc in syllabus_docs}
+    retriever = SyllabusRetriever(syllabuses, args.top_k, args.min_score, args.wide_k)
+
+    # (text, labelled syllabus numbers) of innermost questions, by paper
+    papers = defaultdict(list)
+    parents = {
+        doc["_id"]: doc
+        for collection in ("questions", "sub_questions")
+        for doc in database[collection].find({}, {"text": 1, "parent_id": 1})
+    }
+    for doc in database["mc_questions"].find():
+        text = " ".join(
+            [doc["text"], *(doc.get("options") or []), doc.get("answer") or ""]
+        )
+        papers[doc["paper_name"]].append((text, doc.get("syllabus") or []))
+    for collection, leaf in (
+        ("questions", {"subquestions": {"$in": [None, []]}}),
+        ("sub_questions", {"subsubquestions": {"$in": [None, []]}}),
+        ("sub_sub_questions", {}),
+    ):
+        for doc in database[collection].find(leaf):
+            texts = [doc["text"], doc.get("answer") or ""]
+            parent_id = doc.get("parent_id")
+            while parent_id in parents:
+                texts.insert(0, parents[parent_id]["text"])
+                parent_id = parents[parent_id].get("parent_id")
+            papers[doc["paper_name"]].append(
+                (" ".join(texts), doc.get("syllabus") or [])
+            )
+
+    full_chars = sum(len(str(syllabus)) for syllabus in syllabuses)
+    labelled_papers = [
+        [(text, ids) for text, ids in items if ids]
+        for _, items in sorted(papers.items())
+    ]
+    labelled_papers = [labelled for labelled in labelled_papers if labelled]
+    hits = total = fallbacks = evaluated = 0
+    prompt_chars = 0
+    for start in range(0, len(labelled_papers), args.pack):
+        labelled = sum(labelled_papers[start : start + args.pack], [])
+        evaluated += 1
+        candidates = retriever.candidates([text for text, _ in labelled])
+        if candidates is None:
+            fallbacks += 1
+            prompt_chars += full_chars
+            hits += len(labelled)
+        else:
+            prompt_chars += sum(len(str(syllabus)) for syllabus in candidates)
+            kept = {syllabus.number for syllabus in candidates}
+            hits += sum(any(numbers.get(i) in kept for i in ids) for _, ids in labelled)
+        total += len(labelled)
+
+    print(f"{evaluated} requests, {total} labelled questions")
+    print(f"recall: {hits / max(total, 1):.3f}, full syllabus fallbacks: {fallbacks}")
+    print(f"syllabus prompt size: {prompt_chars / max(evaluated, 1) / full_chars:.2f}x")
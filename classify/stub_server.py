@@ -0,0 +1,133 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+
+class StubChatServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the /chat/completions endpoint. It answers every
+    innermost question of the last user message with a syllabus number
+    picked deterministically from the syllabus sent in the prompt, after
+    `latency` seconds, and fails `fail_rate` of the requests with 429/503.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, fail_rate: float = 0.0):
+        super().__init__(address, StubChatHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    QUESTION_LINE = re.compile(r"^( *)Number:(\S+)")
+    SYLLABUS_NUMBER = re.compile(r"Syllabus\(number=([^,]+),")
+    INDENT = 4
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path != "/chat/completions":
+            self.send_json(404, {"error": "not found"})
+            return
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests += 1
+            fail = random.random() < self.server.fail_rate
+            self.server.failures += fail
+        time.sleep(self.server.latency)
+        if fail:
+            status = random.choice((429, 503))
+            self.send_json(status, {"error": "stub failure"}, {"Retry-After": "0"})
+            return
+        answer = self.answer(body["messages"])
+        self.send_json(
+            200,
+            {
+                "model": body.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop",
+                    }
+                ],
+            },
+        )
+
+    @classmethod
+    def answer(cls, messages: List[dict]) -> str:
+        syllabus_numbers = []
+        for message in messages[:-1]:
+            syllabus_numbers.extend(cls.SYLLABUS_NUMBER.findall(message["content"]))
+        # (depth, number) of every question line, innermost ones get answered
+        entries = []
+        for line in messages[-1]["content"].split("\n"):
+            match = cls.QUESTION_LINE.match(line)
+            if match:
+                entries.append((len(match.group(1)) // cls.INDENT, match.group(2)))
+        lines = []
+        path: List[str] = []
+        for i, (depth, number) in enumerate(entries):
+            path = path[:depth] + [number]
+            if i + 1 < len(entries) and entries[i + 1][0] > depth:
+                continue
+            label = " ".join(path)
+            syllabus = (
+                syllabus_numbers[zlib.crc32(label.encode()) % len(syllabus_numbers)]
+                if syllabus_numbers
+                else "1.1"
+            )
+            lines.append(f"{label}:{syllabus}")
+        return "\n".join(lines)
+
+    def send_json(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: float = 0.0,
+    fail_rate: float = 0.0,
+) -> StubChatServer:
+    # serve in a daemon thread; port 0 picks a free port (server.server_port)
+    server = StubChatServer((host, port), latency=latency, fail_rate=fail_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    # point API_URL at it: API_URL=http://127.0.0.1:8765 python main.py
+    arg_parser = argparse.ArgumentParser(description="Stub chat completions server")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = arg_parser.parse_args()
+
+    server = StubChatServer(
+        (args.host, args.port), latency=args.latency, fail_rate=args.fail_rate
+    )
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from parser.models.syllabus import Syllabus
+
+
+class SyllabusStore:
+    """
+    Keeps a syllabus collection in step with the syllabus PDF. Parsed items are
+    snapshotted on disk by PDF hash + page range + parser parameters, and
+    written to Mongo as upserts keyed by syllabus number, so ids stored on
+    questions stay valid.
+    """
+
+    SNAPSHOT_DIR = "cache/syllabus"
+    # bump when SyllabusParser output changes, to invalidate old snapshots
+    SNAPSHOT_VERSION = 1
+    FIELDS = ("number", "title", "content")
+
+    def __init__(self, collection: Collection, snapshot_dir: str = SNAPSHOT_DIR):
+        self.collection = collection
+        self.snapshot_dir = snapshot_dir
+
+    def snapshot_key(
+        self, pdf_path: str, page_range: Tuple[int, int], params: tuple = ()
+    ) -> str:
+        sha = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return hashlib.sha256(
+            f"{sha.hexdigest()}:{tuple(page_range)!r}:{params!r}:"
+            f"{self.SNAPSHOT_VERSION}".encode("utf-8")
+        ).hexdigest()
+
+    def snapshot_path(self, key: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{key}.json")
+
+    def load_snapshot(self, key: str) -> Optional[List[Syllabus]]:
+        path = self.snapshot_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return [Syllabus(**item) for item in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Syllabus snapshot {key} unreadable: {e}")
+            return None
+
+    def save_snapshot(self, key: str, syllabuses: List[Syllabus]):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = self.snapshot_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([self.document(syllabus) for syllabus in syllabuses], f)
+        os.replace(tmp_path, path)
+
+    def load(
+        self,
+        pdf_path: str,
+        page_range: Tuple[int, int],
+        parse: Callable[[], List[Syllabus]],
+        params: tuple = (),
+    ) -> List[Syllabus]:
+        # parse only when the PDF, page range or parser params (char source,
+        # thresholds) changed since the last run
+        key = self.snapshot_key(pdf_path, page_range, params)
+        syllabuses = self.load_snapshot(key)
+        if syllabuses is None:
+            syllabuses = parse()
+            self.save_snapshot(key, syllabuses)
+        return syllabuses
+
+    def document(self, syllabus: Syllabus) -> dict:
+        return {field: getattr(syllabus, field) for field in self.FIELDS}
+
+    def sync(self, syllabuses: List[Syllabus]) -> int:
+        """
+        Upsert changed items by number and set `id` on every item. Returns
+        how many items were written.
+        """
+        existing: Dict[str, dict] = {}
+        for doc in self.collection.find(
+            {}, {"_id": 1, **dict.fromkeys(self.FIELDS, 1)}
+        ):
+            existing.setdefault(doc["number"], doc)
+
+        operations = []
+        written: List[Syllabus] = []
+        seen: Dict[str, Syllabus] = {}
+        for syllabus in syllabuses:
+            if syllabus.number in seen:
+                # the first item wins, as with lookups by number
+                print(f"Duplicate syllabus number {syllabus.number}")
+                continue
+            seen[syllabus.number] = syllabus
+            document = self.document(syllabus)
+            doc = existing.get(syllabus.number)
+            if doc is not None and all(
+                doc.get(field) == document[field] for field in self.FIELDS
+            ):
+                continue
+            operations.append(
+                UpdateOne({"number": syllabus.number}, {"$set": document}, upsert=True)
+            )
+            written.append(syllabus)
+        ids = {number: doc["_id"] for number, doc in existing.items()}
+        if operations:
+            result = self.collection.bulk_write(operations, ordered=True)
+            # new items get their id from the upsert, updated ones keep theirs
+            for index, inserted_id in result.upserted_ids.items():
+                ids[written[index].number] = inserted_id
+        for syllabus in syllabuses:
+            syllabus.id = ids.get(syllabus.number)
+
+        stale = set(existing) - set(seen)
+        if stale:
+            # kept: questions may still reference them
+            print(f"{len(stale)} syllabus items no longer in the syllabus PDF")
+        return len(written)
@@ -3,16 +3,28 @@ from parser.sq_ms_parser import SQMSParser
 from parser.mcq_parser import MCQParser
 from parser.mcq_ms_parser import MCQMSParser
 from parser.syllabus_parser import SyllabusParser
+from parser.document import PaperDocument
+from parser.glyph_cache import GlyphCache
+from parser.image_sink import ImageSink
+from parser.layout_profile import LayoutProfileCache
 from classify.classify_llm import LLMClassifier
+from classify.response_cache import ResponseCache
+from classify.async_client import ClassifierPool
+from classify.retrieval import SyllabusRetriever
+from db.store import SyllabusStore
 
 from parser.models.question import MultipleChoiceQuestion
 from parser.models.question import Question, SubQuestion, SubSubQuestion
 from parser.models.syllabus import Syllabus
+from parser.models.crop import CropDescriptor
 
-import pdfplumber
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
+import multiprocessing
 import os
+import queue
 import re
+import time
+from concurrent.futures import Future
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from bson import ObjectId
@@ -21,6 +33,41 @@ load_dotenv()
 API_KEY = os.getenv("API_KEY")
 API_URL = os.getenv("API_URL")
 MONGO_URI = os.getenv("MONGO_URI")
+# RENDER_IMAGES=0 parses text only and stores crop descriptors in the
+# image_crops collection instead; render them with
+#   python -m parser.materialize <subject>
+RENDER_IMAGES = os.getenv("RENDER_IMAGES", "1") != "0"
+# CHAR_SOURCE=pymupdf reads question paper and syllabus chars with PyMuPDF
+CHAR_SOURCE = os.getenv("CHAR_SOURCE", "pdfplumber")
+# MS_TABLE_ENGINE=pdf2docx reads mark scheme tables with the pdf2docx Converter
+MS_TABLE_ENGINE = os.getenv("MS_TABLE_ENGINE", "fitz")
+# MCQ_ROW_IMAGES=0 reads multiple choice answer keys from the text layer,
+# skipping table extraction and the per-question mark scheme images
+MCQ_ROW_IMAGES = os.getenv("MCQ_ROW_IMAGES", "1") != "0"
+# MS_WORKERS>1 extracts each mark scheme's tables in that many processes
+MS_WORKERS = int(os.getenv("MS_WORKERS", "1"))
+# INGEST_WORKERS>1 parses papers (question paper + mark scheme) on a pool of
+# that many worker processes; classification and inserts stay in the main
+# process
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+# seconds a worker may spend on one paper before it is killed
+PAPER_TIMEOUT = float(os.getenv("PAPER_TIMEOUT", "900"))
+# LLM_CACHE=replay classifies from cached responses only, LLM_CACHE=off
+# always calls the API
+LLM_CACHE = os.getenv("LLM_CACHE", "on")
+# LLM_CONCURRENCY>1 classifies that many papers at once on a pooled async
+# client, within LLM_TPM estimated tokens per minute (0: no limit)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "1"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+# LLM_PACK papers are planned together, so small papers share requests
+LLM_PACK = int(os.getenv("LLM_PACK", "1"))
+# LLM_RETRIEVAL_K>0 sends only the union of each question's top-k syllabus
+# items by TF-IDF; weakly matching questions add a wider set of items. The
+# union covers most of the syllabus for MCQ papers and packed requests; 4 with
+# LLM_PACK=1 shrinks the syllabus of structured papers to about three quarters
+LLM_RETRIEVAL_K = int(os.getenv("LLM_RETRIEVAL_K", "0"))
+# seconds per LLM request attempt
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
 
 CONFIGS = {
     "igcse-biology-0610": {
@@ -29,7 +76,10 @@ CONFIGS = {
     },
 }
 
-client = MongoClient(MONGO_URI)
+# per process: worker processes build their own on import
+glyph_cache = GlyphCache()
+layout_profiles = LayoutProfileCache()
+image_sink = ImageSink(image_format="png", workers=4)
 
 
 def map_syllabus_to_id(syllabuses: List[Syllabus]) -> dict:
@@ -53,88 +103,396 @@ def convert_obj(obj: Optional[object]) -> Optional[dict]:
 
 
 def parse(
-    classifier: LLMClassifier, question_paper: str, markscheme: str, issq: bool
+    document: PaperDocument,
+    question_paper: str,
+    markscheme: str,
+    issq: bool,
 ) -> List[Question] | List[MultipleChoiceQuestion]:
-    with pdfplumber.open(question_paper) as qppdf:
+    if issq:
+        sq_parser = QuestionPaperParser(
+            document,
+            image_prefix=os.path.basename(question_paper)[:-4],
+            glyph_cache=glyph_cache,
+            layout_profiles=layout_profiles,
+            image_sink=image_sink,
+            render_images=RENDER_IMAGES,
+        )
+        questions = sq_parser.parse_question_paper()
+        sqms_parser = SQMSParser(
+            markscheme,
+            questions,
+            image_prefix=os.path.basename(question_paper)[:-4],
+            image_sink=image_sink,
+            render_images=RENDER_IMAGES,
+            table_engine=MS_TABLE_ENGINE,
+            workers=MS_WORKERS,
+        )
+        questions = sqms_parser.parse_ms()
+        return questions
+    else:
+        mcq_parser = MCQParser(
+            document,
+            image_prefix=os.path.basename(question_paper)[:-4],
+            glyph_cache=glyph_cache,
+            layout_profiles=layout_profiles,
+            image_sink=image_sink,
+            render_images=RENDER_IMAGES,
+        )
+        questions = mcq_parser.parse_question_paper()
+        mcqms_parser = MCQMSParser(
+            markscheme,
+            questions,
+            image_prefix=os.path.basename(question_paper)[:-4],
+            image_sink=image_sink,
+            render_images=RENDER_IMAGES,
+            table_engine=MS_TABLE_ENGINE,
+            workers=MS_WORKERS,
+            row_images=MCQ_ROW_IMAGES,
+        )
+        mcqms_parser.parse_no_error()
+        return questions
+
+
+def parse_paper(question_paper: str, markscheme: str) -> Tuple[bool, list]:
+    # question paper + mark scheme stages, no classification
+    with PaperDocument.open(question_paper, char_source=CHAR_SOURCE) as document:
+        issq = not document.is_multiple_choice()
+        questions = parse(document, question_paper, markscheme, issq)
+    return issq, questions
+
+
+def parse_worker(tasks, results):
+    # a pool process: parse the papers put on its own task queue until None
+    try:
+        for question_paper, markscheme in iter(tasks.get, None):
+            try:
+                issq, questions = parse_paper(question_paper, markscheme)
+                results.put((question_paper, issq, questions, None))
+            except Exception as e:
+                results.put((question_paper, None, None, str(e)))
+    finally:
+        image_sink.close()
+
+
+class ParseWorker:
+    """One process of the parse_papers pool and the paper it is working on."""
+
+    def __init__(self, context, results):
+        self.context = context
+        self.results = results
+        self.question_paper: Optional[str] = None
+        self.started = 0.0
+        self.start()
+
+    def start(self):
+        # a fresh task queue, the old one may be left half read by a kill
+        self.tasks = self.context.SimpleQueue()
+        self.process = self.context.Process(
+            target=parse_worker, args=(self.tasks, self.results)
+        )
+        self.process.start()
+
+    def assign(self, question_paper: str, markscheme: str):
+        self.question_paper = question_paper
+        self.started = time.monotonic()
+        self.tasks.put((question_paper, markscheme))
+
+    def restart(self):
+        self.process.kill()
+        self.process.join()
+        self.question_paper = None
+        self.start()
+
+    def stop(self, wait: float):
+        if self.process.is_alive() and self.question_paper is None:
+            self.tasks.put(None)
+            self.process.join(wait)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+def parse_papers(
+    papers: List[Tuple[str, str]], workers: int, timeout: float
+) -> Iterator[Tuple[str, Optional[bool], Optional[list], Optional[str]]]:
+    """
+    Parse (question paper, mark scheme) pairs, yielding
+    (question paper, issq, questions, error) in completion order. With more
+    than one worker papers are parsed on a fixed pool of processes; a worker
+    that spends more than `timeout` seconds on one paper is killed and
+    replaced.
+    """
+    if workers <= 1:
+        for question_paper, markscheme in papers:
+            try:
+                issq, questions = parse_paper(question_paper, markscheme)
+                yield question_paper, issq, questions, None
+            except Exception as e:
+                yield question_paper, None, None, str(e)
+        return
+
+    # spawn: workers must not inherit the image sink threads or Mongo client
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    pending = list(papers)
+    pool = [ParseWorker(context, results) for _ in range(min(workers, len(papers)))]
+    try:
+        while pending or any(worker.question_paper for worker in pool):
+            for worker in pool:
+                if worker.question_paper is None and pending:
+                    worker.assign(*pending.pop(0))
+
+            # wait up to a second for one result, then drain the rest
+            drained = []
+            try:
+                drained.append(results.get(timeout=1))
+                while True:
+                    drained.append(results.get_nowait())
+            except queue.Empty:
+                pass
+            finished = []
+            for result in drained:
+                for worker in pool:
+                    if worker.question_paper == result[0]:
+                        worker.question_paper = None
+                        finished.append(result)
+                        break
+                # otherwise it is late, the paper was already reported
+
+            # deadlines are checked right after draining, before yielding
+            # pauses this generator, so a paper that finished is never killed
+            now = time.monotonic()
+            for worker in pool:
+                if worker.question_paper is None:
+                    continue
+                if not worker.process.is_alive():
+                    error = f"worker exited with code {worker.process.exitcode}"
+                elif now - worker.started > timeout:
+                    error = f"timed out after {timeout:g}s"
+                else:
+                    continue
+                finished.append((worker.question_paper, None, None, error))
+                worker.restart()
+            yield from finished
+    finally:
+        for worker in pool:
+            worker.stop(wait=5)
+
+
+def classify_papers(
+    classifier: LLMClassifier,
+    parsed: Iterator[Tuple[str, Optional[bool], Optional[list], Optional[str]]],
+) -> Iterator[Tuple[str, Optional[bool], Optional[list], Optional[str]]]:
+    """
+    Classify the papers coming out of parse_papers, yielding the same
+    (question paper, issq, questions, error) tuples. Papers are classified
+    in groups of LLM_PACK, which the planner packs into as few requests as
+    fit. With LLM_CONCURRENCY > 1 groups run concurrently while later papers
+    are still being parsed, and are yielded as their classification finishes.
+    """
+
+    def classify_now(papers: list) -> Future:
+        future = Future()
+        try:
+            future.set_result(classifier.classify_many(papers))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def finished(batch: list, future: Future) -> Iterator[tuple]:
+        try:
+            results = future.result()
+        except Exception as e:
+            for question_paper, issq, _ in batch:
+                yield question_paper, issq, None, str(e)
+            return
+        for (question_paper, issq, _), questions in zip(batch, results):
+            error = None if questions is not None else "LLM classification failed"
+            yield question_paper, issq, questions, error
+
+    pool = (
+        ClassifierPool(
+            classifier,
+            concurrency=LLM_CONCURRENCY,
+            tokens_per_minute=LLM_TPM or None,
+            timeout=LLM_TIMEOUT,
+        )
+        if LLM_CONCURRENCY > 1
+        else None
+    )
+    submit = pool.submit_many if pool is not None else classify_now
+    pending = []  # (batch, future)
+    batch = []  # (question paper, issq, questions)
+    try:
+        for question_paper, issq, questions, error in parsed:
+            if error is not None:
+                yield question_paper, issq, questions, error
+                continue
+            print("Classifying", question_paper)
+            batch.append((question_paper, issq, questions))
+            if len(batch) >= LLM_PACK:
+                pending.append((batch, submit([item[2] for item in batch])))
+                batch = []
+            # hand finished papers to the writer while the rest are in flight
+            for item in [item for item in pending if item[1].done()]:
+                pending.remove(item)
+                yield from finished(*item)
+        if batch:
+            pending.append((batch, submit([item[2] for item in batch])))
+        for item in pending:
+            yield from finished(*item)
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def pop_crops(question, crops: List[CropDescriptor]):
+    # deferred images are kept in their own collection, not on the question
+    for field in ("image_crop", "ms_image_crop"):
+        crop = question.__dict__.pop(field, None)
+        if crop is not None:
+            crops.append(crop)
+
+
+def insert_questions(database, paper_name: str, issq: bool, questions: list):
+    question_collection = database["questions"]
+    squestion_collection = database["sub_questions"]
+    ssquestion_collection = database["sub_sub_questions"]
+    mc_question_collection = database["mc_questions"]
+    crops: List[CropDescriptor] = []
+
+    for question in questions:
+        question.paper_name = paper_name
+        pop_crops(question, crops)
         if issq:
-            sq_parser = QuestionPaperParser(
-                qppdf, image_prefix=os.path.basename(question_paper)[:-4]
-            )
-            questions = sq_parser.parse_question_paper()
-            sqms_parser = SQMSParser(
-                markscheme,
-                questions,
-                image_prefix=os.path.basename(question_paper)[:-4],
-            )
-            questions = sqms_parser.parse_ms()
-            questions = classifier.classify_all(questions)
-            return questions
+            squestions = question.subquestions
+            question.syllabus = map_syllabus_to_id(question.syllabus)
+            question.subquestions = []
+            question_dict = convert_obj(question)
+            question_res = question_collection.insert_one(question_dict)
+            subquestion_ids = []
+            for squestion in squestions:
+                squestion.paper_name = paper_name
+                squestion.parent_id = question_res.inserted_id
+                squestion.parent_number = question.number
+                squestion.syllabus = map_syllabus_to_id(squestion.syllabus)
+                pop_crops(squestion, crops)
+
+                ssquestions = squestion.subsubquestions
+                squestion.subsubquestions = []
+                squestion_dict = convert_obj(squestion)
+                squestion_res = squestion_collection.insert_one(squestion_dict)
+
+                subsubquestion_ids = []
+                for ssquestion in ssquestions:
+                    ssquestion.paper_name = paper_name
+                    ssquestion.parent_id = squestion_res.inserted_id
+                    ssquestion.parent_number = squestion.number
+                    ssquestion.syllabus = map_syllabus_to_id(ssquestion.syllabus)
+                    pop_crops(ssquestion, crops)
+                    ssquestion_dict = convert_obj(ssquestion)
+                    ssquestion_result = ssquestion_collection.insert_one(
+                        ssquestion_dict
+                    )
+                    subsubquestion_ids.append(ssquestion_result.inserted_id)
+
+                if subsubquestion_ids:
+                    squestion_collection.update_one(
+                        {"_id": squestion_res.inserted_id},
+                        {"$set": {"subsubquestions": subsubquestion_ids}},
+                    )
+
+                subquestion_ids.append(squestion_res.inserted_id)
+
+            if subquestion_ids:
+                question_collection.update_one(
+                    {"_id": question_res.inserted_id},
+                    {"$set": {"subquestions": subquestion_ids}},
+                )
         else:
-            mcq_parser = MCQParser(
-                qppdf, image_prefix=os.path.basename(question_paper)[:-4]
-            )
-            questions = mcq_parser.parse_question_paper()
-            mcqms_parser = MCQMSParser(
-                markscheme,
-                questions,
-                image_prefix=os.path.basename(question_paper)[:-4],
-            )
-            mcqms_parser.parse_no_error()
-            questions = classifier.classify_all(questions)
-            return questions
-
-
-print("\n".join(config for config in CONFIGS.keys()))
-subject = input("Select a config: ")
-config = CONFIGS[subject]
-syllabus_path = config["syllabus_path"]
-syllabus_page_range = config["syllabus_page_range"]
-database = client[subject]
-
-with pdfplumber.open(syllabus_path) as pdf:
-    syllabuses = SyllabusParser(pdf, syllabus_page_range).parse_syllabus()
-
-database["syllabus"].delete_many({})
-for syllabus in syllabuses:
-    syllabus_dict = convert_obj(syllabus)
-    result = database["syllabus"].insert_one(syllabus_dict)
-    syllabus.id = result.inserted_id
-print(f"Inserted {len(syllabuses)} syllabus items.")
-classifier = LLMClassifier(syllabuses=syllabuses, api_key=API_KEY, api_url=API_URL)
-
-question_collection = database["questions"]
-squestion_collection = database["sub_questions"]
-ssquestion_collection = database["sub_sub_questions"]
-mc_question_collection = database["mc_questions"]
-
-error_list = []
-reprocess = [
-    "0610_s20_qp_31",
-    "0610_s22_qp_23",
-    "0610_s24_qp_13",
-    "0610_w18_qp_33",
-    "0610_w19_qp_13",
-    "0610_w20_qp_13",
-    "0610_w21_qp_33",
-    "0610_w21_qp_62",
-    "0610_w22_qp_51",
-]
-for f in os.listdir("papers/igcse-biology-0610"):
-    try:
+            question.paper_name = paper_name
+            question.syllabus = map_syllabus_to_id(question.syllabus)
+            question_dict = convert_obj(question)
+            mc_question_collection.insert_one(question_dict)
+
+    if crops:
+        database["image_crops"].insert_many(
+            [{"paper_name": paper_name, **crop.to_document()} for crop in crops]
+        )
+
+    # collection = database[collection_name]
+    # for question in questions:
+    #     question_dict = convert_obj(question)
+    #     collection.insert_one(question_dict)
+
+
+def main():
+    client = MongoClient(MONGO_URI)
+
+    print("\n".join(config for config in CONFIGS.keys()))
+    subject = input("Select a config: ")
+    config = CONFIGS[subject]
+    syllabus_path = config["syllabus_path"]
+    syllabus_page_range = config["syllabus_page_range"]
+    database = client[subject]
+
+    def parse_syllabus() -> List[Syllabus]:
+        with PaperDocument.open(syllabus_path, char_source=CHAR_SOURCE) as document:
+            return SyllabusParser(
+                document, syllabus_page_range, glyph_cache=glyph_cache
+            ).parse_syllabus()
+
+    # reuse the parsed syllabus while the PDF is unchanged, and upsert by
+    # number so syllabus ids stored on questions stay valid
+    syllabus_store = SyllabusStore(database["syllabus"])
+    syllabuses = syllabus_store.load(
+        syllabus_path,
+        syllabus_page_range,
+        parse_syllabus,
+        SyllabusParser.snapshot_params(CHAR_SOURCE),
+    )
+    written = syllabus_store.sync(syllabuses)
+    print(f"Loaded {len(syllabuses)} syllabus items, {written} written.")
+    response_cache = ResponseCache(mode=LLM_CACHE)
+    classifier = LLMClassifier(
+        syllabuses=syllabuses,
+        api_key=API_KEY,
+        api_url=API_URL,
+        response_cache=response_cache,
+        retriever=(
+            SyllabusRetriever(syllabuses, top_k=LLM_RETRIEVAL_K)
+            if LLM_RETRIEVAL_K > 0
+            else None
+        ),
+    )
+
+    question_collection = database["questions"]
+    mc_question_collection = database["mc_questions"]
+
+    error_list = []
+    reprocess = [
+        "0610_s20_qp_31",
+        "0610_s22_qp_23",
+        "0610_s24_qp_13",
+        "0610_w18_qp_33",
+        "0610_w19_qp_13",
+        "0610_w20_qp_13",
+        "0610_w21_qp_33",
+        "0610_w21_qp_62",
+        "0610_w22_qp_51",
+    ]
+    papers = []
+    for f in os.listdir("papers/igcse-biology-0610"):
         if "qp" not in f:
             continue
 
         question_paper = os.path.join("papers/igcse-biology-0610", f)
         markscheme = question_paper.replace("qp", "ms")
-        print("Processing", question_paper)
 
         if not os.path.exists(markscheme):
             print("Markscheme not found for", question_paper)
             continue
 
-        with pdfplumber.open(question_paper, pages=[1]) as qppdf:
-            issq = "Multiple Choice" not in qppdf.pages[0].extract_text()
-
         paper_name = os.path.basename(question_paper)[:-4]
 
         # if database[collection_name].count_documents({}) > 0:
@@ -146,69 +504,31 @@ for f in os.listdir("papers/igcse-biology-0610"):
         ):
             print("Already processed", question_paper)
             continue
+        papers.append((question_paper, markscheme))
 
-        questions = parse(classifier, question_paper, markscheme, issq)
+    print(f"Processing {len(papers)} papers with {INGEST_WORKERS} worker(s)")
+    # this loop is the single writer: workers only parse and classify
+    for question_paper, issq, questions, error in classify_papers(
+        classifier, parse_papers(papers, INGEST_WORKERS, PAPER_TIMEOUT)
+    ):
+        try:
+            if error is not None:
+                raise RuntimeError(error)
+            print("Processing", question_paper)
+            paper_name = os.path.basename(question_paper)[:-4]
+            insert_questions(database, paper_name, issq, questions)
+        except Exception as e:
+            print("Error processing", question_paper, ":", str(e))
+            error_list.append((question_paper, str(e)))
+            continue
 
-        for question in questions:
-            question.paper_name = paper_name
-            if issq:
-                squestions = question.subquestions
-                question.syllabus = map_syllabus_to_id(question.syllabus)
-                question.subquestions = []
-                question_dict = convert_obj(question)
-                question_res = question_collection.insert_one(question_dict)
-                subquestion_ids = []
-                for squestion in squestions:
-                    squestion.paper_name = paper_name
-                    squestion.parent_id = question_res.inserted_id
-                    squestion.parent_number = question.number
-                    squestion.syllabus = map_syllabus_to_id(squestion.syllabus)
-
-                    ssquestions = squestion.subsubquestions
-                    squestion.subsubquestions = []
-                    squestion_dict = convert_obj(squestion)
-                    squestion_res = squestion_collection.insert_one(squestion_dict)
-
-                    subsubquestion_ids = []
-                    for ssquestion in ssquestions:
-                        ssquestion.paper_name = paper_name
-                        ssquestion.parent_id = squestion_res.inserted_id
-                        ssquestion.parent_number = squestion.number
-                        ssquestion.syllabus = map_syllabus_to_id(ssquestion.syllabus)
-                        ssquestion_dict = convert_obj(ssquestion)
-                        ssquestion_result = ssquestion_collection.insert_one(
-                            ssquestion_dict
-                        )
-                        subsubquestion_ids.append(ssquestion_result.inserted_id)
-
-                    if subsubquestion_ids:
-                        squestion_collection.update_one(
-                            {"_id": squestion_res.inserted_id},
-                            {"$set": {"subsubquestions": subsubquestion_ids}},
-                        )
-
-                    subquestion_ids.append(squestion_res.inserted_id)
-
-                if subquestion_ids:
-                    question_collection.update_one(
-                        {"_id": question_res.inserted_id},
-                        {"$set": {"subquestions": subquestion_ids}},
-                    )
-            else:
-                question.paper_name = paper_name
-                question.syllabus = map_syllabus_to_id(question.syllabus)
-                question_dict = convert_obj(question)
-                mc_question_collection.insert_one(question_dict)
-
-        # collection = database[collection_name]
-        # for question in questions:
-        #     question_dict = convert_obj(question)
-        #     collection.insert_one(question_dict)
-    except Exception as e:
-        print("Error processing", question_paper, ":", str(e))
-        error_list.append((question_paper, str(e)))
-        continue
-
-with open("error_log.txt", "w") as f:
-    for error in error_list:
-        f.write(f"{error[0]}: {error[1]}\n")
+    image_sink.close()
+    print(f"LLM cache: {response_cache.hits} hits, {response_cache.misses} misses")
+
+    with open("error_log.txt", "w") as f:
+        for error in error_list:
+            f.write(f"{error[0]}: {error[1]}\n")
+
+
+if __name__ == "__main__":
+    main()
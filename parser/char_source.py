@@ -0,0 +1,228 @@
+import re
+import fitz
+import numpy as np
+import pdfplumber
+from typing import Dict, List, Optional
+from pdfminer.fontmetrics import FONT_METRICS
+from parser.chars import CharStore
+
+
+class CharSource:
+    """
+    Reads the glyphs of one PDF page as a CharStore of x (left), y (baseline
+    descent, from the page bottom), page, bold and codepoint, so the parsers
+    do not depend on which PDF library extracted them.
+    """
+
+    name = ""
+
+    def page_text(self, index: int) -> str:
+        # raw glyph order, without any word/line clustering
+        # This method should be overridden in subclasses
+        pass
+
+    def read_page(self, index: int, page: Optional[int] = None) -> CharStore:
+        # chars of page `index`, labelled `page` (defaults to index)
+        # This method should be overridden in subclasses
+        pass
+
+    def close(self):
+        pass
+
+
+class PdfplumberCharSource(CharSource):
+    name = "pdfplumber"
+
+    def __init__(self, pdf: pdfplumber.PDF):
+        self.pdf = pdf
+        self._chars: Dict[int, List[dict]] = {}
+
+    def page_chars(self, index: int) -> List[dict]:
+        if index not in self._chars:
+            self._chars[index] = self.pdf.pages[index].chars
+        return self._chars[index]
+
+    def page_text(self, index: int) -> str:
+        return "".join(char["text"] for char in self.page_chars(index))
+
+    def read_page(self, index: int, page: Optional[int] = None) -> CharStore:
+        return CharStore.from_pdfplumber(
+            self.page_chars(index), page=index if page is None else page
+        )
+
+
+class PyMuPDFCharSource(CharSource):
+    """
+    Glyphs from MuPDF's text trace, which lists spans in content stream order
+    like pdfminer does, without the line grouping of get_text("rawdict"). y is
+    rebuilt the way pdfminer does it: baseline plus the font's descent, taken
+    from the standard 14 metrics or the font descriptor.
+    """
+
+    name = "pymupdf"
+    SUBSET_PREFIX = re.compile(r"^[A-Z]{6}\+")
+    REFERENCE = re.compile(r"(\d+) 0 R")
+    BOLD_FLAG = 16  # fitz.TEXT_FONT_BOLD
+
+    def __init__(self, path: str):
+        self.doc = fitz.open(path)
+        self._descents: Dict[int, Dict[str, float]] = {}
+        self._pages: Dict[int, CharStore] = {}
+
+    def close(self):
+        self.doc.close()
+
+    def font_descent(self, xref: int, basefont: str) -> float:
+        # pdfminer prefers the standard 14 metrics over the font descriptor
+        if basefont in FONT_METRICS:
+            descent = FONT_METRICS[basefont][0]["Descent"]
+        else:
+            kind, value = self.doc.xref_get_key(xref, "DescendantFonts")
+            match = self.REFERENCE.search(value) if kind in ("array", "xref") else None
+            if match:
+                xref = int(match.group(1))
+            kind, value = self.doc.xref_get_key(xref, "FontDescriptor/Descent")
+            descent = float(value) if kind in ("int", "float") else 0.0
+        return -abs(descent) / 1000
+
+    def page_descents(self, index: int) -> Dict[str, float]:
+        if index not in self._descents:
+            descents = {}
+            for xref, _, _, basefont, _, _ in self.doc[index].get_fonts():
+                name = self.SUBSET_PREFIX.sub("", basefont)
+                descents.setdefault(name, self.font_descent(xref, basefont))
+            self._descents[index] = descents
+        return self._descents[index]
+
+    def page_chars(self, index: int) -> CharStore:
+        # each page's texttrace is walked once, for type detection and parsing
+        if index not in self._pages:
+            self._pages[index] = self.extract_page(index)
+        return self._pages[index]
+
+    def page_text(self, index: int) -> str:
+        return self.page_chars(index).text
+
+    def read_page(self, index: int, page: Optional[int] = None) -> CharStore:
+        chars = self.page_chars(index)
+        if page is None or page == index:
+            return chars
+        return CharStore(
+            x=chars.x,
+            y=chars.y,
+            page=np.full(len(chars), page, np.int16),
+            bold=chars.bold,
+            code=chars.code,
+        )
+
+    def extract_page(self, index: int) -> CharStore:
+        fitz_page = self.doc[index]
+        descents = self.page_descents(index)
+        # fitz coordinates are top-down from the cropbox, map back to PDF space
+        a, b, c, d, e, f = ~fitz_page.transformation_matrix
+        x, y, bold, code = [], [], [], []
+        for span in fitz_page.get_texttrace():
+            descent = descents.get(self.SUBSET_PREFIX.sub("", span["font"]), 0.0)
+            offset = descent * span["size"]
+            is_bold = bool(span["flags"] & self.BOLD_FLAG)
+            for ucs, _, (origin_x, origin_y), _ in span["chars"]:
+                # unmapped glyphs, which pdfplumber reports as "(cid:n)"
+                if ucs == 0xFFFD or ucs < 0:
+                    continue
+                x.append(a * origin_x + c * origin_y + e)
+                y.append(b * origin_x + d * origin_y + f + offset)
+                bold.append(is_bold)
+                code.append(ucs)
+        return CharStore(
+            x=x,
+            y=y,
+            page=np.full(len(code), index, np.int16),
+            bold=bold,
+            code=code,
+        )
+
+
+CHAR_SOURCES = ("pdfplumber", "pymupdf")
+
+
+def open_char_source(name: str, pdf: pdfplumber.PDF, path: Optional[str]):
+    if name == "pdfplumber":
+        return PdfplumberCharSource(pdf)
+    if name == "pymupdf":
+        if not path:
+            raise ValueError("the pymupdf char source needs the PDF path")
+        return PyMuPDFCharSource(path)
+    raise ValueError(f"Unknown char source: {name}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import time
+    from parser.document import PaperDocument
+    from parser.mcq_parser import MCQParser
+    from parser.sq_parser import QuestionPaperParser
+
+    # parity check and benchmark of the char sources on real papers:
+    #   python -m parser.char_source papers/igcse-biology-0610
+    arg_parser = argparse.ArgumentParser(description="Compare char sources")
+    arg_parser.add_argument("paths", nargs="+", help="PDF files or directories")
+    args = arg_parser.parse_args()
+
+    pdf_paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            pdf_paths.extend(
+                os.path.join(path, f)
+                for f in sorted(os.listdir(path))
+                if f.endswith(".pdf") and "qp" in f
+            )
+        else:
+            pdf_paths.append(path)
+
+    def question_tree(questions) -> list:
+        # number and text of every question, subquestion and subsubquestion
+        return [
+            (
+                question.number,
+                question.text,
+                question_tree(
+                    getattr(question, "subquestions", None)
+                    or getattr(question, "subsubquestions", None)
+                    or []
+                ),
+            )
+            for question in questions
+        ]
+
+    timings = {name: 0.0 for name in CHAR_SOURCES}
+    mismatches = 0
+    for pdf_path in pdf_paths:
+        trees = {}
+        for name in CHAR_SOURCES:
+            try:
+                with PaperDocument.open(pdf_path, char_source=name) as document:
+                    start = time.perf_counter()
+                    parser_class = (
+                        MCQParser
+                        if document.is_multiple_choice()
+                        else QuestionPaperParser
+                    )
+                    parser = parser_class(
+                        document,
+                        image_prefix=os.path.basename(pdf_path)[:-4],
+                        render_images=False,
+                    )
+                    timings[name] += time.perf_counter() - start
+                    trees[name] = question_tree(parser.parse_question_paper())
+            except Exception as e:
+                trees[name] = f"error: {e}"
+        same = trees["pdfplumber"] == trees["pymupdf"]
+        mismatches += not same
+        print("same" if same else "DIFFERENT", pdf_path)
+
+    print(f"{len(pdf_paths) - mismatches}/{len(pdf_paths)} papers identical")
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:.2f}s reading chars")
+    if timings["pymupdf"] > 0:
+        print(f"speedup: {timings['pdfplumber'] / timings['pymupdf']:.1f}x")
@@ -0,0 +1,157 @@
+import re
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+
+
+class CharStore:
+    """
+    Columnar store for the glyphs of a paper: parallel arrays for x, y, page,
+    bold flag and codepoint instead of one dict per char.
+    """
+
+    def __init__(
+        self,
+        x: Iterable[float] = (),
+        y: Iterable[float] = (),
+        page: Iterable[int] = (),
+        bold: Iterable[bool] = (),
+        code: Iterable[int] = (),
+    ):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.page = np.asarray(page, dtype=np.int16)
+        self.bold = np.asarray(bold, dtype=np.bool_)
+        self.code = np.asarray(code, dtype=np.uint32)
+        self._text: Optional[str] = None
+        self._text_index: Optional["TextIndex"] = None
+        self._masks: Dict[tuple, np.ndarray] = {}
+
+    @classmethod
+    def from_pdfplumber(cls, page_chars: List[dict], page: int) -> "CharStore":
+        # multi-codepoint glyphs (ligatures etc.) are dropped, as before
+        page_chars = [char for char in page_chars if len(char["text"]) == 1]
+        n = len(page_chars)
+        return cls(
+            x=np.fromiter((char["x0"] for char in page_chars), np.float64, n),
+            y=np.fromiter((char["y0"] for char in page_chars), np.float64, n),
+            page=np.full(n, page, dtype=np.int16),
+            bold=np.fromiter(
+                ("bold" in char["fontname"].lower() for char in page_chars),
+                np.bool_,
+                n,
+            ),
+            code=np.fromiter((ord(char["text"]) for char in page_chars), np.uint32, n),
+        )
+
+    @classmethod
+    def concatenate(cls, stores: List["CharStore"]) -> "CharStore":
+        if not stores:
+            return cls()
+        return cls(
+            x=np.concatenate([store.x for store in stores]),
+            y=np.concatenate([store.y for store in stores]),
+            page=np.concatenate([store.page for store in stores]),
+            bold=np.concatenate([store.bold for store in stores]),
+            code=np.concatenate([store.code for store in stores]),
+        )
+
+    @staticmethod
+    def decode(codes: np.ndarray) -> str:
+        return codes.astype("<u4").tobytes().decode("utf-32-le")
+
+    @property
+    def text(self) -> str:
+        # one char per glyph, so string positions are char indices
+        if self._text is None:
+            self._text = self.decode(self.code)
+        return self._text
+
+    def __len__(self) -> int:
+        return len(self.code)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return {
+                "x": float(self.x[key]),
+                "y": float(self.y[key]),
+                "text": chr(self.code[key]),
+                "bold": bool(self.bold[key]),
+                "page": int(self.page[key]),
+            }
+        return CharStore(
+            self.x[key], self.y[key], self.page[key], self.bold[key], self.code[key]
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def near_x_mask(self, x: float, difference: float) -> np.ndarray:
+        # chars within `difference` of x
+        key = ("near", x, difference)
+        if key not in self._masks:
+            self._masks[key] = np.abs(self.x - x) <= difference
+        return self._masks[key]
+
+    def between_x_mask(self, low: float, high: float) -> np.ndarray:
+        # chars whose rounded x lies in [low, high]
+        key = ("between", low, high)
+        if key not in self._masks:
+            x = np.round(self.x)
+            self._masks[key] = (low <= x) & (x <= high)
+        return self._masks[key]
+
+    @property
+    def text_index(self) -> "TextIndex":
+        if self._text_index is None:
+            self._text_index = TextIndex(self)
+        return self._text_index
+
+    def bold_indices(self) -> np.ndarray:
+        bold = np.flatnonzero(self.bold)
+        if len(bold) == 0:
+            # from 2024 papers onwards, there is no font information
+            return np.arange(len(self))
+        return bold
+
+
+class TextIndex:
+    """
+    Text of a CharStore built once per paper: the raw glyph string, a spaced
+    string with a space before every line break (y change), and offsets
+    mapping char indices into the spaced string.
+    """
+
+    def __init__(self, chars: CharStore):
+        self.text = chars.text
+        new_line = np.abs(np.diff(chars.y)) > 1
+        self.line_breaks = np.flatnonzero(new_line) + 1
+        self.offsets = np.arange(len(chars), dtype=np.int64)
+        self.offsets[1:] += np.cumsum(new_line)
+        spaced = np.full(len(chars) + len(self.line_breaks), ord(" "), np.uint32)
+        spaced[self.offsets] = chars.code
+        self.spaced = CharStore.decode(spaced)
+
+    def join(self, start: int, end: int) -> str:
+        # chars[start:end] with a space on every y change, as an O(1) slice
+        if end <= start:
+            return ""
+        return self.spaced[self.offsets[start] : self.offsets[end - 1] + 1]
+
+    def find_markers(
+        self,
+        pattern: re.Pattern,
+        mask: np.ndarray,
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> List[re.Match]:
+        # matches of pattern starting in [start, end) on a masked char; a match
+        # may run past `end`, like the fixed-size windows it replaces
+        end = len(self.text) if end is None else end
+        matches = []
+        for match in pattern.finditer(self.text, start):
+            if match.start() >= end:
+                break
+            if mask[match.start()]:
+                matches.append(match)
+        return matches
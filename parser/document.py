@@ -0,0 +1,117 @@
+import pdfplumber
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+from parser.chars import CharStore
+from parser.char_source import CharSource, open_char_source
+
+# (page index, (x0, top, x1, bottom)) in PDF points
+Region = Tuple[int, Tuple[float, float, float, float]]
+
+
+class PaperDocument:
+    """
+    A PDF whose per-page characters are extracted once and cached, so paper type
+    detection, blank page checks, char reading and image cropping all share the
+    same pdfplumber pages. Chars come from the named CharSource; images are
+    always rendered by pdfplumber.
+    """
+
+    RASTER_CACHE_SIZE = 2  # pages kept rendered; crops arrive in page order
+    BLANK_PAGE_PATTERN = re.compile(r"BLANK\s*PAGE")
+    MULTIPLE_CHOICE_PATTERN = re.compile(r"Multiple\s*Choice")
+
+    def __init__(
+        self,
+        pdf: pdfplumber.PDF,
+        path: Optional[str] = None,
+        char_source: str = "pdfplumber",
+    ):
+        self.pdf = pdf
+        self.path = path if path else getattr(pdf.stream, "name", None)
+        self.char_source: CharSource = open_char_source(char_source, pdf, self.path)
+        self._texts: Dict[int, str] = {}
+        self._rasters: OrderedDict[Tuple[int, float], Image.Image] = OrderedDict()
+
+    @classmethod
+    def open(cls, path: str, char_source: str = "pdfplumber") -> "PaperDocument":
+        return cls(pdfplumber.open(path), path=path, char_source=char_source)
+
+    def close(self):
+        self.char_source.close()
+        self.pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.pdf.pages)
+
+    @property
+    def pages(self) -> List[pdfplumber.page.Page]:
+        return self.pdf.pages
+
+    def read_page(self, index: int, page: Optional[int] = None) -> CharStore:
+        return self.char_source.read_page(index, page)
+
+    def page_text(self, index: int) -> str:
+        # raw glyph order, without the word/line clustering of extract_text()
+        if index not in self._texts:
+            self._texts[index] = self.char_source.page_text(index)
+        return self._texts[index]
+
+    def is_blank(self, index: int) -> bool:
+        return bool(self.BLANK_PAGE_PATTERN.search(self.page_text(index)))
+
+    def is_multiple_choice(self) -> bool:
+        return bool(self.MULTIPLE_CHOICE_PATTERN.search(self.page_text(0)))
+
+    def render_page(self, index: int, resolution: float) -> Image.Image:
+        key = (index, resolution)
+        if key in self._rasters:
+            self._rasters.move_to_end(key)
+            return self._rasters[key]
+        image = self.pdf.pages[index].to_image(resolution=resolution).original
+        self._rasters[key] = image
+        while len(self._rasters) > self.RASTER_CACHE_SIZE:
+            self._rasters.popitem(last=False)
+        return image
+
+    def crop_image(
+        self, index: int, bbox: Tuple[float, float, float, float], resolution: float
+    ) -> Image.Image:
+        # bbox is (x0, top, x1, bottom) in PDF points, like pdfplumber's page.crop
+        page = self.pdf.pages[index]
+        # let pdfplumber validate the bbox so bad crops fail exactly as before
+        bbox = page.crop(bbox).bbox
+        image = self.render_page(index, resolution)
+        # same pixel projection pdfplumber applies when rendering a cropped page
+        scale = image.width / (page.cropbox[2] - page.cropbox[0])
+        left = -int((page.cropbox[0] - bbox[0]) * scale)
+        top = -int((page.cropbox[1] - bbox[1]) * scale)
+        return image.crop(
+            (
+                left,
+                top,
+                left + int((bbox[2] - bbox[0]) * scale),
+                top + int((bbox[3] - bbox[1]) * scale),
+            )
+        )
+
+    def render_regions(self, regions: List[Region], resolution: float) -> Image.Image:
+        images = [self.crop_image(page, bbox, resolution) for page, bbox in regions]
+        # If multiple pages, stitch images together vertically
+        if len(images) > 1:
+            stitched = Image.new(
+                "RGB", (images[0].width, sum(im.height for im in images))
+            )
+            y_offset = 0
+            for im in images:
+                stitched.paste(im, (0, y_offset))
+                y_offset += im.height
+            return stitched
+        return images[0]
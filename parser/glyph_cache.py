@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import os
+import shutil
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+from parser.chars import CharStore
+
+
+class GlyphCache:
+    """
+    On-disk cache of CharStore columns, one directory of .npy files per PDF.
+    Entries are keyed by the PDF's SHA-256 plus the thresholds used to filter
+    its chars, loaded memory-mapped and evicted least-recently-used first.
+    """
+
+    CACHE_DIR = "cache/glyphs"
+    MAX_BYTES = 512 * 1024 * 1024
+    COLUMNS = ("x", "y", "page", "bold", "code")
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._digests: Dict[Tuple[str, int, float], str] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def file_digest(self, pdf_path: str) -> str:
+        stat = os.stat(pdf_path)
+        memo_key = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime)
+        if memo_key not in self._digests:
+            sha = hashlib.sha256()
+            with open(pdf_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(block)
+            self._digests[memo_key] = sha.hexdigest()
+        return self._digests[memo_key]
+
+    def key(self, pdf_path: str, params: tuple) -> str:
+        # the thresholds change which chars survive filtering, so they are part of the key
+        return hashlib.sha256(
+            f"{self.file_digest(pdf_path)}:{params!r}".encode("utf-8")
+        ).hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key: str) -> Optional[CharStore]:
+        path = self.entry_path(key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            columns = {
+                column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r")
+                for column in self.COLUMNS
+            }
+        except (OSError, ValueError) as e:
+            print(f"Glyph cache entry {key} unreadable: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        # touch the entry so eviction sees it as recently used
+        os.utime(path)
+        return CharStore(**columns)
+
+    def store(self, key: str, chars: CharStore):
+        path = self.entry_path(key)
+        if os.path.isdir(path):
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        for column in self.COLUMNS:
+            np.save(os.path.join(tmp_path, f"{column}.npy"), getattr(chars, column))
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.prune()
+
+    def get_or_read(
+        self, pdf_path: str, params: tuple, read: Callable[[], CharStore]
+    ) -> CharStore:
+        key = self.key(pdf_path, params)
+        chars = self.load(key)
+        if chars is None:
+            chars = read()
+            self.store(key, chars)
+        return chars
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        # (key, size in bytes, last used), least recently used first
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            path = self.entry_path(key)
+            if key.endswith(".tmp") or not os.path.isdir(path):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+            )
+            entries.append((key, size, os.path.getmtime(path)))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def prune(self, max_bytes: Optional[int] = None) -> int:
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for key, size, _ in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(self.entry_path(key), ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+
+def warm(cache: GlyphCache, pdf_paths: List[str], syllabus_pages: Optional[tuple]):
+    from parser.document import PaperDocument
+    from parser.mcq_parser import MCQParser
+    from parser.sq_parser import QuestionPaperParser
+    from parser.syllabus_parser import SyllabusParser
+
+    for pdf_path in pdf_paths:
+        try:
+            with PaperDocument.open(pdf_path) as document:
+                if syllabus_pages:
+                    SyllabusParser(document, syllabus_pages, glyph_cache=cache)
+                elif document.is_multiple_choice():
+                    MCQParser(document, glyph_cache=cache)
+                else:
+                    QuestionPaperParser(document, glyph_cache=cache)
+            print("Cached", pdf_path)
+        except Exception as e:
+            print("Error caching", pdf_path, ":", str(e))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Manage the glyph cache")
+    arg_parser.add_argument("--cache-dir", default=GlyphCache.CACHE_DIR)
+    arg_parser.add_argument("--max-bytes", type=int, default=GlyphCache.MAX_BYTES)
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    warm_parser = commands.add_parser("warm", help="cache the chars of PDFs")
+    warm_parser.add_argument("paths", nargs="+", help="PDF files or directories")
+    warm_parser.add_argument(
+        "--syllabus-pages",
+        nargs=2,
+        type=int,
+        help="treat the PDFs as syllabi and read this page range",
+    )
+    commands.add_parser("prune", help="evict entries until under --max-bytes")
+    commands.add_parser("stats", help="print cache size")
+    args = arg_parser.parse_args()
+
+    cache = GlyphCache(args.cache_dir, args.max_bytes)
+    if args.command == "warm":
+        pdf_paths = []
+        for path in args.paths:
+            if os.path.isdir(path):
+                pdf_paths.extend(
+                    os.path.join(path, f)
+                    for f in sorted(os.listdir(path))
+                    if f.endswith(".pdf") and "qp" in f
+                )
+            else:
+                pdf_paths.append(path)
+        warm(
+            cache,
+            pdf_paths,
+            tuple(args.syllabus_pages) if args.syllabus_pages else None,
+        )
+    elif args.command == "prune":
+        print(f"Removed {cache.prune()} entries")
+    print(f"{len(cache.entries())} entries, {cache.size() / 1024 / 1024:.1f} MiB")
@@ -0,0 +1,97 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+from PIL import Image
+
+
+class ImageSink:
+    """
+    Encodes and writes parser output images on a pool of background threads.
+    submit() blocks only while `max_pending` images are queued; flush() is the
+    barrier parsers call at the end of each paper.
+    """
+
+    FORMATS = {
+        # format name: (file extension, PIL format, default save options)
+        "png": (".png", "PNG", {"compress_level": 6}),
+        "webp": (".webp", "WEBP", {"quality": 80, "method": 4}),
+        "webp-lossless": (".webp", "WEBP", {"lossless": True, "quality": 80}),
+    }
+
+    def __init__(
+        self,
+        image_format: str = "png",
+        workers: int = 4,
+        max_pending: int = 16,
+        **save_options,
+    ):
+        if image_format not in self.FORMATS:
+            raise ValueError(f"Unknown image format: {image_format}")
+        self.image_format = image_format
+        self.extension, self.pil_format, options = self.FORMATS[image_format]
+        self.save_options = {**options, **save_options}
+        self.workers = workers
+        self._executor = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-sink")
+            if workers > 0
+            else None
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending: List[Future] = []
+        self._lock = threading.Lock()
+
+    def path(self, stem: str) -> str:
+        # target path for an image stem in the configured format
+        return stem + self.extension
+
+    def submit(self, image: Image.Image, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if self._executor is None:
+            self._save(image, path)
+            return path
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._save, image, path)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        with self._lock:
+            self._pending.append(future)
+        return path
+
+    def _save(self, image: Image.Image, path: str):
+        image.save(path, format=self.pil_format, **self.save_options)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        errors = [future.exception() for future in pending]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_default_sink: Optional[ImageSink] = None
+
+
+def default_sink() -> ImageSink:
+    # shared PNG sink used when a parser is not given one explicitly
+    global _default_sink
+    if _default_sink is None:
+        _default_sink = ImageSink()
+    return _default_sink
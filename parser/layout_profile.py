@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Optional
+from parser.chars import CharStore
+from parser.document import PaperDocument
+
+
+class LayoutProfileCache:
+    """
+    Position constants detected by the question paper parsers, cached per
+    layout fingerprint (parser, paper series, page size, font info) and
+    persisted as one JSON file per fingerprint, so papers sharing a template
+    skip detection and parallel ingest workers never overwrite each other.
+    """
+
+    CACHE_DIR = "cache/layout_profiles"
+    # bump when find_position_constants changes, to invalidate cached profiles
+    VERSION = 2
+    # 0610_w23_qp_42 -> series 0610_w23_qp_4x
+    SERIES_PATTERN = re.compile(r"(\d{4})_([a-z]\d{2})_qp_(\d)\d")
+
+    def __init__(self, cache_dir: Optional[str] = CACHE_DIR):
+        # cache_dir None keeps profiles in memory only
+        self.cache_dir = cache_dir
+        self.profiles: Dict[str, dict] = {}
+
+    @classmethod
+    def fingerprint(
+        cls,
+        parser_name: str,
+        image_prefix: str,
+        document: PaperDocument,
+        chars: CharStore,
+    ) -> Optional[str]:
+        match = cls.SERIES_PATTERN.search(image_prefix)
+        if not match:
+            return None
+        page = document.pages[1] if len(document) > 1 else document.pages[0]
+        return ":".join(
+            [
+                parser_name,
+                f"{match.group(1)}_{match.group(2)}_qp_{match.group(3)}x",
+                f"{round(page.width)}x{round(page.height)}",
+                "bold" if chars.bold.any() else "plain",
+            ]
+        )
+
+    def profile_path(self, fingerprint: str) -> str:
+        key = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, fingerprint: Optional[str]) -> Optional[dict]:
+        if fingerprint is None:
+            return None
+        if fingerprint in self.profiles or not self.cache_dir:
+            return self.profiles.get(fingerprint)
+        path = self.profile_path(fingerprint)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Layout profile {fingerprint} unreadable: {e}")
+            return None
+        # profiles of older detection heuristics are dropped
+        if (
+            not isinstance(cached, dict)
+            or cached.get("version") != self.VERSION
+            or cached.get("fingerprint") != fingerprint
+        ):
+            return None
+        self.profiles[fingerprint] = cached["constants"]
+        return self.profiles[fingerprint]
+
+    def put(self, fingerprint: Optional[str], constants: dict):
+        if fingerprint is None:
+            return
+        self.profiles[fingerprint] = constants
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.profile_path(fingerprint)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": self.VERSION,
+                    "fingerprint": fingerprint,
+                    "constants": constants,
+                },
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, path)
@@ -1,5 +1,7 @@
+import fitz  # PyMuPDF
 import pdfplumber
 from typing import List, Tuple
+from parser.ms_parser import Parser
 
 
 class MarkSchemeParser:
@@ -7,8 +9,11 @@ class MarkSchemeParser:
         self.pdf = pdf
 
     def extract_lines(self) -> List[List[Tuple[float, float]]]:
+        # only the pages holding a Question/Answer/Marks table
+        with fitz.open(self.pdf.stream.name) as fitz_pdf:
+            table_pages = Parser.table_pages(fitz_pdf)
         lines = []
-        for page in self.pdf.pages[5:]:
+        for page in (self.pdf.pages[i] for i in table_pages):
             page_lines = [(rect["x0"], rect["y0"]) for rect in page.rects]
             lines.append(page_lines)
         return lines
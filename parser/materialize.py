@@ -0,0 +1,124 @@
+import os
+import fitz  # PyMuPDF
+from typing import Dict, Iterable, List, Optional
+from PIL import Image
+from parser.document import PaperDocument
+from parser.image_sink import ImageSink, default_sink
+from parser.models.crop import CropDescriptor
+from parser.models.question import (
+    MultipleChoiceQuestion,
+    Question,
+    SubQuestion,
+    SubSubQuestion,
+)
+
+
+def collect_crops(
+    questions: Iterable[
+        Question | SubQuestion | SubSubQuestion | MultipleChoiceQuestion
+    ],
+) -> List[CropDescriptor]:
+    # every deferred image recorded on a question tree parsed in text-only mode
+    crops = []
+    for question in questions:
+        for crop in (question.image_crop, question.ms_image_crop):
+            if crop is not None:
+                crops.append(crop)
+        crops.extend(collect_crops(getattr(question, "subquestions", None) or []))
+        crops.extend(collect_crops(getattr(question, "subsubquestions", None) or []))
+    return crops
+
+
+def render_fitz_crop(fitz_pdf: fitz.Document, crop: CropDescriptor) -> Image.Image:
+    scale = crop.resolution / 72
+    images = []
+    for page, bbox in crop.regions:
+        pix = fitz_pdf[page].get_pixmap(matrix=fitz.Matrix(scale, scale), clip=bbox)
+        images.append(Image.frombytes("RGB", (pix.width, pix.height), pix.samples))
+    if len(images) > 1:
+        stitched = Image.new("RGB", (images[0].width, sum(im.height for im in images)))
+        y_offset = 0
+        for im in images:
+            stitched.paste(im, (0, y_offset))
+            y_offset += im.height
+        return stitched
+    return images[0]
+
+
+def materialize(
+    crops: Iterable[CropDescriptor],
+    image_sink: Optional[ImageSink] = None,
+    only_missing: bool = True,
+) -> int:
+    """
+    Render and save deferred crops, opening each source PDF once. With
+    `only_missing`, crops whose target image already exists are skipped.
+    Returns the number of images written.
+    """
+    image_sink = image_sink if image_sink is not None else default_sink()
+    by_pdf: Dict[str, List[CropDescriptor]] = {}
+    for crop in crops:
+        if only_missing and os.path.exists(crop.path):
+            continue
+        by_pdf.setdefault(crop.pdf_path, []).append(crop)
+
+    written = 0
+    for pdf_path, pdf_crops in by_pdf.items():
+        # render in page order so the page raster cache is reused
+        pdf_crops.sort(key=lambda crop: crop.regions[0][0])
+        document = None
+        fitz_pdf = None
+        try:
+            for crop in pdf_crops:
+                if crop.renderer == "fitz":
+                    if fitz_pdf is None:
+                        fitz_pdf = fitz.open(pdf_path)
+                    image = render_fitz_crop(fitz_pdf, crop)
+                else:
+                    if document is None:
+                        document = PaperDocument.open(pdf_path)
+                    image = document.render_regions(crop.regions, crop.resolution)
+                image_sink.submit(image, crop.path)
+                written += 1
+        finally:
+            if document is not None:
+                document.close()
+            if fitz_pdf is not None:
+                fitz_pdf.close()
+    image_sink.flush()
+    return written
+
+
+def materialize_crop(
+    crop: CropDescriptor, image_sink: Optional[ImageSink] = None
+) -> str:
+    # lazily produce a single image, e.g. when it is first requested
+    materialize([crop], image_sink, only_missing=True)
+    return crop.path
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    # render the crops main.py stored with RENDER_IMAGES=0:
+    #   python -m parser.materialize igcse-biology-0610 [--paper 0610_s20_qp_31]
+    arg_parser = argparse.ArgumentParser(description="Render deferred images")
+    arg_parser.add_argument("subject", help="database with an image_crops collection")
+    arg_parser.add_argument("--paper", help="only this paper name")
+    arg_parser.add_argument(
+        "--all", action="store_true", help="also re-render images already on disk"
+    )
+    args = arg_parser.parse_args()
+
+    load_dotenv()
+    database = MongoClient(os.getenv("MONGO_URI"))[args.subject]
+    query = {"paper_name": args.paper} if args.paper else {}
+    crops = [
+        CropDescriptor.from_document(doc) for doc in database["image_crops"].find(query)
+    ]
+    image_sink = default_sink()
+    written = materialize(crops, image_sink, only_missing=not args.all)
+    image_sink.close()
+    print(f"{written} of {len(crops)} images written")
@@ -1,21 +1,83 @@
+import fitz  # PyMuPDF
+import re
 from parser.ms_parser import Parser
 from typing import List, Optional
 from parser.models.question import MultipleChoiceQuestion
+from parser.image_sink import ImageSink
 
 
 class MCQMSParser(Parser):
+    # "12 B 1": question number, answer letter and mark on one table row
+    ANSWER_ROW = re.compile(r"(?<!\S)(\d{1,3}) ([A-D]) (\d{1,2})(?!\S)")
+    ROW_TOLERANCE = 2  # words whose bottoms are this close share a row
+
     def __init__(
         self,
         pdf_path: str,
         mcqs: List[MultipleChoiceQuestion],
         image_prefix: str = "example",
+        image_sink: Optional[ImageSink] = None,
+        render_images: bool = True,
+        table_engine: str = "fitz",
+        workers: int = 1,
+        row_images: bool = True,
     ):
         self.mcqs = mcqs
-        super().__init__(pdf_path, image_prefix)
+        # without row images the answer key is read from the text layer alone,
+        # and the questions get no mark scheme image
+        self.row_images = row_images
+        super().__init__(
+            pdf_path, image_prefix, image_sink, render_images, table_engine, workers
+        )
+
+    def parse(self) -> list[dict[str, str]]:
+        if self.row_images:
+            return super().parse()
+        return self.read_answer_key()
+
+    def read_answer_key(self) -> list[dict[str, str]]:
+        # one pass over the words of the pages holding the answer table
+        rows = []
+        with fitz.open(self.pdf_path) as fitz_pdf:
+            for fitz_page in fitz_pdf:
+                words = fitz_page.get_text("words")
+                if not self.isms([word[4] for word in words]):
+                    continue
+                for line in self.group_rows(words):
+                    for match in self.ANSWER_ROW.finditer(line):
+                        rows.append(
+                            {
+                                "Question": match.group(1),
+                                "Answer": match.group(2),
+                                "Marks": match.group(3),
+                                "Image": None,
+                            }
+                        )
+        return rows
+
+    def group_rows(self, words: list) -> List[str]:
+        # words sharing a baseline, left to right, as one string per row
+        lines = []
+        line = []
+        for word in sorted(words, key=lambda word: (word[3], word[0])):
+            if line and word[3] - line[-1][3] > self.ROW_TOLERANCE:
+                lines.append(line)
+                line = []
+            line.append(word)
+        if line:
+            lines.append(line)
+        return [
+            " ".join(word[4] for word in sorted(line, key=lambda word: word[0]))
+            for line in lines
+        ]
+
+    def answer_rows(self) -> list[dict[str, str]]:
+        # rows with a plain question number, which drops headers and totals
+        return [row for row in self.tables if row["Question"].isdigit()]
 
     def parse_no_error(self):
         # parse if there is no parse error in ms and qp
-        for question, answer in zip(self.mcqs, self.tables[1:]):
+        for question, answer in zip(self.mcqs, self.answer_rows()):
             if question.number != int(answer["Question"]):
                 print(
                     f"Question number mismatch: {question.number} != {answer['Question']}, switching to parse_with_error"
@@ -24,13 +86,14 @@ class MCQMSParser(Parser):
             question.answer = answer["Answer"]
             question.marks = int(answer["Marks"])
             question.ms_image = answer["Image"]
+            question.ms_image_crop = answer.get("ImageCrop")
         return True
 
     def parse_with_error(self):
         # parse if there is parse error in ms and qp
         # sort questions and answers by number for easier matching
         self.mcqs.sort(key=lambda x: x.number)
-        answers = sorted(self.tables[1:], key=lambda x: int(x["Question"]))
+        answers = sorted(self.answer_rows(), key=lambda x: int(x["Question"]))
 
         # Initialize two pointers
         q_ptr = 0  # pointer for questions
@@ -45,6 +108,7 @@ class MCQMSParser(Parser):
                 self.mcqs[q_ptr].answer = answers[a_ptr]["Answer"]
                 self.mcqs[q_ptr].marks = int(answers[a_ptr]["Marks"])
                 self.mcqs[q_ptr].ms_image = answers[a_ptr]["Image"]
+                self.mcqs[q_ptr].ms_image_crop = answers[a_ptr].get("ImageCrop")
                 q_ptr += 1
                 a_ptr += 1
             elif q_num < a_num:
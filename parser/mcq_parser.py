@@ -1,71 +1,69 @@
 from parser.qp_parser import Parser
+from parser.chars import CharStore
 from parser.models.question import MultipleChoiceQuestion
 import re
-from PIL import Image
+import numpy as np
 
 
 class MCQParser(Parser):
     QUESTION_START_X = 49.6063
     DIFFERENCE = 5
     IGNORE_PAGE_FOOTER_Y = 40
+    QUESTION_MARKER = re.compile(r"\d")
 
     def find_position_constant(self):
-        bold_chars = [char for char in self.chars if char["bold"]]
-        if len(bold_chars) == 0:
-            # from 2024 papers onwards, there is no font information
-            bold_chars = self.chars
-        bold_strings = "".join(char["text"] for char in bold_chars)
+        bold_chars = self.chars.bold_indices()
+        bold_strings = CharStore.decode(self.chars.code[bold_chars])
         # find the first 1
         first_one_index = bold_strings.index("1")
-        first_one_char = bold_chars[first_one_index]
-        self.QUESTION_START_X = first_one_char["x"]
+        self.QUESTION_START_X = float(self.chars.x[bold_chars[first_one_index]])
 
     def find_question_starts(self):
         question_starts = []
         current_number = 1
-        for i, char in enumerate(self.chars):
-            if abs(char["x"] - self.QUESTION_START_X) <= self.DIFFERENCE:
-                text = "".join(c["text"] for c in self.chars[i : i + 3])
-                if re.match(f"{current_number}", text):
-                    question_starts.append(i)
-                    current_number += 1
+        index = self.chars.text_index
+        for match in index.find_markers(
+            self.QUESTION_MARKER,
+            self.chars.near_x_mask(self.QUESTION_START_X, self.DIFFERENCE),
+        ):
+            if index.text.startswith(str(current_number), match.start()):
+                question_starts.append(match.start())
+                current_number += 1
         return question_starts
 
     def find_options(self, start: int, end: int):
         option_starts = []
         current_alpha = "A"
-        for i in range(start, end):
-            if not self.chars[i]["bold"]:
-                continue
-            if self.chars[i]["text"] == current_alpha:
-                option_starts.append(i)
+        # only bold capitals can start an option
+        codes = self.chars.code[start:end]
+        candidates = np.flatnonzero(
+            self.chars.bold[start:end] & (codes >= ord("A")) & (codes <= ord("Z"))
+        )
+        for i in candidates + start:
+            if self.chars.code[i] == ord(current_alpha):
+                option_starts.append(int(i))
                 current_alpha = chr(ord(current_alpha) + 1)
         return option_starts
 
     def parse_question(self, start_index: int, end_index: int, number: int):
-        start_y = self.chars[start_index + 1]["y"]
-        page = self.chars[start_index]["page"]
+        start_y = float(self.chars.y[start_index + 1])
+        page = int(self.chars.page[start_index])
         end_y = (
-            self.chars[end_index + 1]["y"]
+            float(self.chars.y[end_index + 1])
             if end_index + 1 < len(self.chars)
-            and self.chars[end_index + 1]["page"] == page
+            and self.chars.page[end_index + 1] == page
             else self.IGNORE_PAGE_FOOTER_Y
         )
-        image = self.extract_image_inpage(
-            page=page,
-            y0=start_y,
-            y1=end_y,
+        image_path, image_crop = self.save_image(
+            [self.inpage_image_region(page=page, y0=start_y, y1=end_y)],
+            f"{self.image_prefix}_question_{number}",
             resolution=200,
         )
-        image_path = f"{self.IMAGE_PATH}{self.image_prefix}_question_{number}.png"
-        image.save(image_path)
 
         option_starts = self.find_options(start_index, end_index)
         if option_starts:
             options = []
-            question_text = "".join(
-                char["text"] for char in self.chars[start_index : option_starts[0]]
-            )
+            question_text = self.chars.text[start_index : option_starts[0]]
             for i, option_start in enumerate(option_starts):
                 if i == len(option_starts) - 1:
                     option_end = end_index
@@ -79,20 +77,17 @@ class MCQParser(Parser):
                 )
         else:
             options = None
-            question_text = "".join(
-                char["text"] for char in self.chars[start_index:end_index]
-            )
+            question_text = self.chars.text[start_index:end_index]
         return MultipleChoiceQuestion(
             number=number,
             text=question_text,
             options=options,
             image=image_path,  # whole question image
+            image_crop=image_crop,
         )
 
     def parse_option(self, start_index: int, end_index: int):
-        option_text = "".join(
-            char["text"] for char in self.chars[start_index:end_index]
-        )
+        option_text = self.chars.text[start_index:end_index]
         return option_text
 
 
@@ -1,5 +1,7 @@
 from .question import Question, SubQuestion, SubSubQuestion, MultipleChoiceQuestion
 from .syllabus import Syllabus
+from .crop import CropDescriptor
+from .question_tree import QuestionTree
 
 __all__ = [
     "Question",
@@ -7,4 +9,6 @@ __all__ = [
     "SubSubQuestion",
     "MultipleChoiceQuestion",
     "Syllabus",
+    "CropDescriptor",
+    "QuestionTree",
 ]
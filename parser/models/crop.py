@@ -0,0 +1,43 @@
+from dataclasses import dataclass
+from typing import List, Tuple
+
+
+@dataclass
+class CropDescriptor:
+
+    def __init__(
+        self,
+        pdf_path: str,
+        regions: List[Tuple[int, Tuple[float, float, float, float]]],
+        path: str,
+        resolution: float = 200,
+        renderer: str = "pdfplumber",
+    ):
+        self.pdf_path = pdf_path
+        # (page index, (x0, top, x1, bottom)) in PDF points, stitched vertically
+        self.regions = regions
+        self.path = path  # target image path
+        self.resolution = resolution  # dpi
+        self.renderer = renderer  # "pdfplumber" or "fitz"
+
+    def to_document(self) -> dict:
+        return {
+            "pdf_path": self.pdf_path,
+            "regions": [[page, list(bbox)] for page, bbox in self.regions],
+            "path": self.path,
+            "resolution": self.resolution,
+            "renderer": self.renderer,
+        }
+
+    @classmethod
+    def from_document(cls, document: dict) -> "CropDescriptor":
+        return cls(
+            document["pdf_path"],
+            [(page, tuple(bbox)) for page, bbox in document["regions"]],
+            document["path"],
+            document.get("resolution", 200),
+            document.get("renderer", "pdfplumber"),
+        )
+
+    def __repr__(self):
+        return f"CropDescriptor({self.path!r}, {self.pdf_path!r}, {self.regions!r})"
@@ -2,6 +2,7 @@ from dataclasses import dataclass
 from typing import List, Optional
 from PIL.Image import Image
 from .syllabus import Syllabus
+from .crop import CropDescriptor
 
 
 @dataclass
@@ -16,6 +17,8 @@ class SubSubQuestion:
         image: Optional[str] = None,  # image of the whole question
         ms_image: Optional[str] = None,  # image of the mark scheme
         syllabus: List[Syllabus] = None,  # syllabus of the question
+        image_crop: Optional[CropDescriptor] = None,  # deferred image
+        ms_image_crop: Optional[CropDescriptor] = None,  # deferred mark scheme image
     ):
         self.number = number  # roman numeral
         self.text = text
@@ -24,6 +27,8 @@ class SubSubQuestion:
         self.image = image
         self.ms_image = ms_image
         self.syllabus = syllabus if syllabus is not None else []
+        self.image_crop = image_crop
+        self.ms_image_crop = ms_image_crop
 
     def __str__(self):
         return self.text
@@ -42,6 +47,8 @@ class SubQuestion:
         image: Optional[str | List[str]] = None,  # image of the whole question
         ms_image: Optional[str | List[str]] = None,  # image of the mark scheme
         syllabus: Optional[List[Syllabus]] = None,  # syllabus of the question
+        image_crop: Optional[CropDescriptor] = None,  # deferred image
+        ms_image_crop: Optional[CropDescriptor] = None,  # deferred mark scheme image
     ):
         self.number = number  # a, b, c...
         self.text = text
@@ -51,6 +58,8 @@ class SubQuestion:
         self.image = image
         self.ms_image = ms_image
         self.syllabus = syllabus if syllabus is not None else []
+        self.image_crop = image_crop
+        self.ms_image_crop = ms_image_crop
 
     def __str__(self):
         return self.text + (f"\n{self.subsubquestions}" if self.subsubquestions else "")
@@ -68,6 +77,8 @@ class Question:
         image: Optional[str | List[str]] = None,  # image of the whole question
         ms_image: Optional[str | List[str]] = None,  # image of the mark scheme
         syllabus: Optional[List[Syllabus]] = None,  # syllabus of the question
+        image_crop: Optional[CropDescriptor] = None,  # deferred image
+        ms_image_crop: Optional[CropDescriptor] = None,  # deferred mark scheme image
     ):
         self.number = number
         self.text = text
@@ -77,6 +88,8 @@ class Question:
         self.image = image
         self.ms_image = ms_image
         self.syllabus = syllabus if syllabus is not None else []
+        self.image_crop = image_crop
+        self.ms_image_crop = ms_image_crop
 
     def __str__(self):
         return f"({self.number}): {self.text}" + (
@@ -96,6 +109,8 @@ class MultipleChoiceQuestion:
         image: Optional[str] = None,
         ms_image: Optional[str] = None,
         syllabus: Optional[List[Syllabus]] = None,  # syllabus of the question
+        image_crop: Optional[CropDescriptor] = None,  # deferred image
+        ms_image_crop: Optional[CropDescriptor] = None,  # deferred mark scheme image
     ):
         self.number = number
         self.text = text
@@ -104,6 +119,8 @@ class MultipleChoiceQuestion:
         self.image = image
         self.ms_image = ms_image
         self.syllabus = syllabus if syllabus is not None else []
+        self.image_crop = image_crop
+        self.ms_image_crop = ms_image_crop
 
     def __str__(self):
         return f"({self.number}): {self.text}" + (
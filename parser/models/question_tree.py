@@ -0,0 +1,109 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from .question import Question, SubQuestion, SubSubQuestion, MultipleChoiceQuestion
+from .syllabus import Syllabus
+
+Node = Question | SubQuestion | SubSubQuestion | MultipleChoiceQuestion
+# (question number, subquestion letter, subsubquestion numeral), trailing
+# levels may be None
+Numbers = Tuple
+
+
+class QuestionTree:
+    """
+    Index over the questions of one paper keyed by path ("4", "4a", "4ai"),
+    so mark scheme rows and classifier output lines are assigned with dict
+    lookups instead of scans.
+    """
+
+    def __init__(self, questions: List[Question] | List[MultipleChoiceQuestion]):
+        self.questions = questions
+        self.index: Dict[str, Node] = {}
+        # depth of each path, so "4", "ai" cannot resolve to "4", "a", "i"
+        self.levels: Dict[str, int] = {}
+        for question in questions:
+            self.add(question, question.number)
+            for subquestion in getattr(question, "subquestions", None) or []:
+                self.add(subquestion, question.number, subquestion.number)
+                for subsubquestion in subquestion.subsubquestions or []:
+                    self.add(
+                        subsubquestion,
+                        question.number,
+                        subquestion.number,
+                        subsubquestion.number,
+                    )
+
+    @staticmethod
+    def path(*numbers) -> str:
+        # 4, "a", "i" -> "4ai"
+        return "".join(str(number) for number in numbers if number is not None)
+
+    def add(self, node: Node, *numbers):
+        path = self.path(*numbers)
+        # keep the first node on duplicate numbers, as next() scans did
+        if path not in self.index:
+            self.index[path] = node
+            self.levels[path] = len(numbers)
+
+    def get(self, *numbers) -> Optional[Node]:
+        numbers = [number for number in numbers if number is not None]
+        path = self.path(*numbers)
+        if self.levels.get(path) != len(numbers):
+            return None
+        return self.index[path]
+
+    def assign(self, numbers: Numbers, **fields) -> bool:
+        # set fields on the node at numbers, if the paper has it
+        node = self.get(*numbers)
+        if node is None:
+            return False
+        for name, value in fields.items():
+            setattr(node, name, value)
+        return True
+
+    def assign_many(self, assignments: Iterable[Tuple[Numbers, dict]]) -> int:
+        # bulk assign (numbers, fields) pairs, returns how many nodes matched
+        return sum(self.assign(numbers, **fields) for numbers, fields in assignments)
+
+    def tag_syllabus(
+        self,
+        syllabus: Syllabus,
+        question_number: int,
+        subquestion_number: Optional[str] = None,
+        subsubquestion_number: Optional[str] = None,
+    ) -> bool:
+        # tag the deepest existing level and append the tag to its ancestors;
+        # a question without parts takes the tag itself
+        question = self.get(question_number)
+        if question is None:
+            return False
+        if not subquestion_number or not getattr(question, "subquestions", None):
+            question.syllabus = [syllabus]
+            return True
+
+        subquestion = self.get(question_number, subquestion_number)
+        if subquestion is None:
+            return False
+        if not subsubquestion_number or not subquestion.subsubquestions:
+            subquestion.syllabus = [syllabus]
+            question.syllabus.append(syllabus)
+            return True
+
+        subsubquestion = self.get(
+            question_number, subquestion_number, subsubquestion_number
+        )
+        if subsubquestion is None:
+            return False
+        subsubquestion.syllabus = [syllabus]
+        subquestion.syllabus.append(syllabus)
+        question.syllabus.append(syllabus)
+        return True
+
+    def tag_many(
+        self, tags: Iterable[Tuple[Syllabus, Numbers]]
+    ) -> List[Tuple[Syllabus, Numbers]]:
+        # bulk tag_syllabus, returns the tags whose question was not found
+        return [
+            (syllabus, numbers)
+            for syllabus, numbers in tags
+            if not self.tag_syllabus(syllabus, *numbers)
+        ]
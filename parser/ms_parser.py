@@ -1,30 +1,163 @@
 from pdf2docx import Converter
 import fitz  # PyMuPDF
+import math
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pprint import pprint
+from typing import Iterator, List, Optional, Tuple
+from PIL import Image
+from parser.image_sink import ImageSink, default_sink
+from parser.models.crop import CropDescriptor
+
+# (page index, header cells, [(row cells, row bbox), ...]) of one table
+Table = Tuple[int, List[str], List[Tuple[List[str], tuple]]]
 
 
 class Parser:
     IMAGE_PATH = "images/"
+    ROW_IMAGE_SCALE = 2  # Increase resolution
+    # "fitz": PyMuPDF find_tables, "pdf2docx": the original Converter path
+    TABLE_ENGINES = ("fitz", "pdf2docx")
+    # a mark scheme table page has the header keywords and a ruled grid
+    TABLE_KEYWORDS = ("Question", "Answer", "Marks")
+    MIN_RULING_LINES = 4
+    RULING_THICKNESS = 2  # rects thinner than this are drawn as lines
 
-    def __init__(self, pdf_path: str, image_prefix: str = "example"):
+    def __init__(
+        self,
+        pdf_path: str,
+        image_prefix: str = "example",
+        image_sink: Optional[ImageSink] = None,
+        render_images: bool = True,
+        table_engine: str = "fitz",
+        workers: int = 1,
+        pages: Optional[List[int]] = None,
+    ):
+        if table_engine not in self.TABLE_ENGINES:
+            raise ValueError(f"Unknown table engine: {table_engine}")
         self.pdf_path = pdf_path
         self.image_prefix = image_prefix
+        self.image_sink = image_sink if image_sink is not None else default_sink()
+        self.render_images = render_images
+        self.table_engine = table_engine
+        # workers > 1 extracts tables from page chunks in worker processes
+        self.workers = workers
+        # page indices to read, None probes the whole mark scheme
+        self.pages = pages
+        # (page index, page rect, pixmap, image) of the last rasterized page
+        self._page_raster: Optional[tuple] = None
         self.tables = self.parse()
 
     def parse(self) -> list[dict[str, str]]:
-        # Initialize converter
-        cv = Converter(self.pdf_path)
         fitz_pdf = fitz.open(self.pdf_path)
+        try:
+            # skip the marking principles and other pages without a table
+            pages = self.table_pages(fitz_pdf) if self.pages is None else self.pages
+            if self.workers > 1 and len(pages) > 1:
+                return self.parse_in_workers(pages)
+            combined = []
+            tables = (
+                self.fitz_tables(fitz_pdf, pages)
+                if self.table_engine == "fitz"
+                else self.pdf2docx_tables(pages)
+            )
+            for page_id, headers, rows in tables:
+                # Check if the table is a valid MS table
+                if not self.isms(headers):
+                    print("not a valid MS table", headers)
+                    continue
+                for row_content, row_bbox in rows:
+                    combined.append(
+                        self.process_row(
+                            fitz_pdf, page_id, headers, row_content, row_bbox
+                        )
+                    )
+        finally:
+            self._page_raster = None
+            fitz_pdf.close()
+            # wait for the row images to be written
+            self.image_sink.flush()
+
+        return combined
+
+    def parse_in_workers(self, pages: List[int]) -> list[dict[str, str]]:
+        # contiguous page chunks, merged back in page order
+        size = math.ceil(len(pages) / self.workers)
+        chunks = [pages[i : i + size] for i in range(0, len(pages), size)]
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(len(chunks), mp_context=context) as executor:
+            results = executor.map(
+                parse_page_chunk,
+                [
+                    (
+                        self.pdf_path,
+                        self.image_prefix,
+                        self.image_sink.image_format,
+                        self.image_sink.save_options,
+                        self.render_images,
+                        self.table_engine,
+                        chunk,
+                    )
+                    for chunk in chunks
+                ],
+            )
+            return [row for rows in results for row in rows]
+
+    @classmethod
+    def table_pages(cls, fitz_pdf: fitz.Document) -> List[int]:
+        # cheap probe: header keywords in the text layer, then ruling lines
+        pages = []
+        for fitz_page in fitz_pdf:
+            words = set(fitz_page.get_text().split())
+            if not all(keyword in words for keyword in cls.TABLE_KEYWORDS):
+                continue
+            if cls.count_ruling_lines(fitz_page) >= cls.MIN_RULING_LINES:
+                pages.append(fitz_page.number)
+        return pages
+
+    @classmethod
+    def count_ruling_lines(cls, fitz_page: fitz.Page) -> int:
+        count = 0
+        for drawing in fitz_page.get_drawings():
+            for item in drawing["items"]:
+                if item[0] == "l":
+                    start, end = item[1], item[2]
+                    count += start.x == end.x or start.y == end.y
+                elif item[0] == "re":
+                    rect = item[1]
+                    count += min(rect.width, rect.height) < cls.RULING_THICKNESS
+        return count
+
+    @staticmethod
+    def cell_text(text: Optional[str]) -> str:
+        return text.replace("\n", "").strip() if text else ""
+
+    def fitz_tables(self, fitz_pdf: fitz.Document, pages: List[int]) -> Iterator[Table]:
+        # grid rebuilt by PyMuPDF from the ruling lines and word boxes
+        for page_id in pages:
+            fitz_page = fitz_pdf[page_id]
+            for table in fitz_page.find_tables().tables:
+                cells = table.extract()
+                if not cells:
+                    continue
+                yield page_id, [self.cell_text(text) for text in cells[0]], [
+                    ([self.cell_text(text) for text in row_cells], row.bbox)
+                    for row_cells, row in zip(cells[1:], table.rows[1:])
+                ]
+
+    def pdf2docx_tables(self, pages: List[int]) -> Iterator[Table]:
+        # full DOCX layout reconstruction, slower but kept for comparison
+        cv = Converter(self.pdf_path)
 
         # Get default settings and make sure ocr setting exists
         settings = cv.default_settings
 
         try:
+            if not pages:
+                return
             # Parse PDF pages with proper settings
-            cv.parse(**settings)
-
-            combined = []
+            cv.parse(pages=pages, **settings)
 
             # Process each parsed page
             for page in cv.pages:
@@ -41,58 +174,88 @@ class Parser:
                             table_blocks.extend(column.blocks.lattice_table_blocks)
 
                 for table_block in table_blocks:
-                    headers = []
-                    table_content = []
-                    for header in table_block[0]:
-                        if header:
-                            text = header.text.replace("\n", "").strip()
-                            headers.append(text)
-                        else:
-                            headers.append("")
-                    # Check if the table is a valid MS table
-                    if not self.isms(headers):
-                        print("not a valid MS table", headers)
-                        continue
-                    # Process each row except header in the table
-                    for i, row in enumerate(table_block[1:]):
-                        row_content = []
-                        for cell in row:
-                            if cell:
-                                text = cell.text.replace("\n", "").strip()
-                                row_content.append(text)
-                            else:
-                                row_content.append("")
-
-                        row_content_dict = {
-                            header: row_content[j] for j, header in enumerate(headers)
-                        }
-
-                        row_bbox = row.bbox  # Get the bounding box of the table block
-                        matrix = fitz.Matrix(2, 2)  # Increase resolution
-                        fitz_page = fitz_pdf[page.id]
-
-                        pix = fitz_page.get_pixmap(matrix=matrix, clip=row_bbox)
-                        # Save the image of the row
-                        image_path = (
-                            self.IMAGE_PATH
-                            + self.image_prefix
-                            + "_"
-                            + row_content_dict["Question"].replace(" ", "_")
-                            + ".png"
+                    headers = [
+                        self.cell_text(header.text if header else None)
+                        for header in table_block[0]
+                    ]
+                    # every row except the header
+                    yield page.id, headers, [
+                        (
+                            [
+                                self.cell_text(cell.text if cell else None)
+                                for cell in row
+                            ],
+                            row.bbox,
                         )
-                        pix.save(image_path)
-                        print(f"Saved row image to {image_path}")
-
-                        row_content_dict["Image"] = image_path
-                        # Add row content and position to respective lists
-                        table_content.append(row_content_dict)
-                    combined.extend(table_content)
+                        for row in table_block[1:]
+                    ]
         finally:
             # Close the converter
             cv.close()
-            fitz_pdf.close()
 
-        return combined
+    def process_row(
+        self,
+        fitz_pdf: fitz.Document,
+        page_id: int,
+        headers: List[str],
+        row_content: List[str],
+        row_bbox: tuple,
+    ) -> dict:
+        row_content_dict = {header: row_content[j] for j, header in enumerate(headers)}
+
+        image_path = self.image_sink.path(
+            self.IMAGE_PATH
+            + self.image_prefix
+            + "_"
+            + row_content_dict["Question"].replace(" ", "_")
+        )
+        if self.render_images:
+            # Save the image of the row
+            self.image_sink.submit(
+                self.row_image(fitz_pdf, page_id, row_bbox), image_path
+            )
+            print(f"Saved row image to {image_path}")
+        else:
+            # text-only mode: describe the row image for later
+            row_content_dict["ImageCrop"] = CropDescriptor(
+                self.pdf_path,
+                [(page_id, tuple(row_bbox))],
+                image_path,
+                resolution=72 * self.ROW_IMAGE_SCALE,
+                renderer="fitz",
+            )
+
+        row_content_dict["Image"] = image_path
+        return row_content_dict
+
+    def row_image(
+        self, fitz_pdf: fitz.Document, page_id: int, row_bbox: tuple
+    ) -> Image.Image:
+        # rows arrive in page order: rasterize each page once and cut the
+        # rows out of it, the same pixels get_pixmap(clip=row_bbox) renders
+        matrix = fitz.Matrix(self.ROW_IMAGE_SCALE, self.ROW_IMAGE_SCALE)
+        if self._page_raster is None or self._page_raster[0] != page_id:
+            fitz_page = fitz_pdf[page_id]
+            pix = fitz_page.get_pixmap(matrix=matrix)
+            image = Image.frombuffer(
+                "RGB",
+                (pix.width, pix.height),
+                pix.samples_mv,
+                "raw",
+                "RGB",
+                pix.stride,
+                1,
+            )
+            self._page_raster = (page_id, fitz_page.rect, pix, image)
+        _, page_rect, pix, image = self._page_raster
+        irect = ((fitz.Rect(row_bbox) & page_rect) * matrix).irect
+        if irect.is_empty:
+            pix = fitz_pdf[page_id].get_pixmap(matrix=matrix, clip=row_bbox)
+            return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        # crop copies just the row, the page buffer stays shared
+        return image.crop(
+            (irect.x0 - pix.x, irect.y0 - pix.y, irect.x1 - pix.x, irect.y1 - pix.y)
+        )
 
     @staticmethod
     def isms(page_table):
@@ -110,6 +273,28 @@ class Parser:
         return True
 
 
+def parse_page_chunk(args: tuple) -> list[dict[str, str]]:
+    # worker process: rows and row images of one chunk of mark scheme pages
+    (
+        pdf_path,
+        image_prefix,
+        image_format,
+        save_options,
+        render_images,
+        table_engine,
+        pages,
+    ) = args
+    with ImageSink(image_format, **save_options) as image_sink:
+        return Parser(
+            pdf_path,
+            image_prefix,
+            image_sink=image_sink,
+            render_images=render_images,
+            table_engine=table_engine,
+            pages=pages,
+        ).tables
+
+
 if __name__ == "__main__":
     pdf_path = "papers/igcse-biology-0610/0610_m15_ms_32.pdf"
     parser = Parser(pdf_path, image_prefix="0610_m15_ms_32")
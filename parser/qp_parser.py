@@ -1,6 +1,12 @@
+import numpy as np
 import pdfplumber
-import re
-from PIL import Image
+from typing import Dict, List, Optional, Tuple
+from parser.chars import CharStore
+from parser.document import PaperDocument, Region
+from parser.glyph_cache import GlyphCache
+from parser.image_sink import ImageSink, default_sink
+from parser.layout_profile import LayoutProfileCache
+from parser.models.crop import CropDescriptor
 
 
 class Parser:
@@ -10,50 +16,110 @@ class Parser:
     DIFFERENCE = 5
     QUESTION_START_X = 49.6063  # Will be updated
     IMAGE_PATH = "images/"
+    # constants learnt by find_position_constants and cached per layout
+    LAYOUT_CONSTANTS = ("QUESTION_START_X",)
+    EARLY_LAYOUT_PAGES = 3
 
-    def __init__(self, pdf: pdfplumber.PDF, image_prefix: str = ""):
-        self.pdf = pdf
+    def __init__(
+        self,
+        pdf: pdfplumber.PDF | PaperDocument,
+        image_prefix: str = "",
+        glyph_cache: Optional[GlyphCache] = None,
+        image_sink: Optional[ImageSink] = None,
+        render_images: bool = True,
+        layout_profiles: Optional[LayoutProfileCache] = None,
+    ):
+        self.document = pdf if isinstance(pdf, PaperDocument) else PaperDocument(pdf)
+        self.pdf = self.document.pdf
+        self.image_prefix = image_prefix
+        self.glyph_cache = glyph_cache
+        self.layout_profiles = layout_profiles
         self.chars = self.read_texts()
         self.find_position_constants()
-        self.image_prefix = image_prefix
+        self.image_sink = image_sink if image_sink is not None else default_sink()
+        self.render_images = render_images
+
+    def read_texts(self) -> CharStore:
+        if self.glyph_cache is not None and self.document.path:
+            return self.glyph_cache.get_or_read(
+                self.document.path, self.glyph_cache_params(), self.extract_texts
+            )
+        return self.extract_texts()
 
-    def read_texts(self):
-        chars = []
-        for i, page in enumerate(self.pdf.pages[1:]):
-            if re.search(r"BLANK PAGE", page.extract_text()):
+    def glyph_cache_params(self) -> tuple:
+        return (
+            "qp",
+            self.document.char_source.name,
+            self.IGNORE_PAGE_FOOTER_Y,
+            self.PAGE_NUMBER_Y,
+            self.LAST_PAGE_COPYRIGHT_Y,
+        )
+
+    def extract_texts(self) -> CharStore:
+        pages = []
+        for i in range(len(self.document) - 1):
+            if self.document.is_blank(i + 1):
                 continue
-            page_chars = page.chars
-            page_chars = list(
-                filter(
-                    lambda x: x["y0"]
-                    > (
-                        self.IGNORE_PAGE_FOOTER_Y
-                        if (i != len(self.pdf.pages) - 2)
-                        else self.LAST_PAGE_COPYRIGHT_Y
-                    )
-                    and x["y0"] != self.PAGE_NUMBER_Y
-                    and len(x["text"]) == 1,
-                    page_chars,
-                )
+            footer_y = (
+                self.IGNORE_PAGE_FOOTER_Y
+                if (i != len(self.document) - 2)
+                else self.LAST_PAGE_COPYRIGHT_Y
             )
-            chars.extend(
-                [
-                    {
-                        "x": char["x0"],
-                        "y": char["y0"],
-                        "text": char["text"],
-                        "bold": "bold" in char["fontname"].lower(),
-                        "page": i + 1,
-                    }
-                    for char in page_chars
+            page_chars = self.document.read_page(i + 1)
+            # tolerance for the float32 coordinates of the pymupdf char source
+            pages.append(
+                page_chars[
+                    (page_chars.y > footer_y)
+                    & (np.abs(page_chars.y - self.PAGE_NUMBER_Y) > 1e-3)
                 ]
             )
-        return chars
+        return CharStore.concatenate(pages)
 
     def find_position_constants(self):
         # This method should be overridden in subclasses
         pass
 
+    def layout_fingerprint(self) -> Optional[str]:
+        return LayoutProfileCache.fingerprint(
+            type(self).__name__, self.image_prefix, self.document, self.chars
+        )
+
+    def load_layout_profile(self) -> bool:
+        # reuse the constants of a paper with the same layout, if any
+        if self.layout_profiles is None:
+            return False
+        profile = self.layout_profiles.get(self.layout_fingerprint())
+        if profile is None:
+            return False
+        for name in self.LAYOUT_CONSTANTS:
+            if name in profile:
+                value = profile[name]
+                setattr(self, name, tuple(value) if isinstance(value, list) else value)
+        return True
+
+    def save_layout_profile(self):
+        if self.layout_profiles is not None:
+            self.layout_profiles.put(
+                self.layout_fingerprint(),
+                {name: getattr(self, name) for name in self.LAYOUT_CONSTANTS},
+            )
+
+    def find_first_bold(self, markers: List[str]) -> Dict[str, float]:
+        # x of the first bold occurrence of each marker; the first pages are
+        # a prefix of the bold text, so a hit there is the document-wide first
+        bold_chars = self.chars.bold_indices()
+        early_chars = bold_chars[self.chars.page[bold_chars] <= self.EARLY_LAYOUT_PAGES]
+        for chars in (early_chars, bold_chars):
+            bold_strings = CharStore.decode(self.chars.code[chars])
+            found = {
+                marker: float(self.chars.x[chars[bold_strings.index(marker)]])
+                for marker in markers
+                if marker in bold_strings
+            }
+            if len(found) == len(markers):
+                break
+        return found
+
     def parse_question_paper(self):
         questions = []
         question_starts = self.find_question_starts()
@@ -64,65 +130,78 @@ class Parser:
                 question_end = question_starts[i + 1]
             question = self.parse_question(question_start, question_end, i + 1)
             questions.append(question)
+        # wait for this paper's images to be written
+        self.image_sink.flush()
         return questions
 
-    def extract_question_image(
-        self,
-        start_page: int,
-        end_page: int,
-        resolution=200,
-        margin: int = 20,
-    ):
-        images = []
+    def question_image_regions(
+        self, start_page: int, end_page: int, margin: int = 20
+    ) -> List[Region]:
+        regions = []
         for i in range(start_page, end_page + 1):
-            page = self.pdf.pages[i]
+            page = self.document.pages[i]
             # Crop the image to the question area
-            im = (
-                page.crop(
+            regions.append(
+                (
+                    i,
                     (
                         self.QUESTION_START_X - margin,
                         margin,
                         page.width - self.QUESTION_START_X + margin,
                         page.height - margin,
-                    )
+                    ),
                 )
-                .to_image(resolution=resolution)
-                .original
             )
-            images.append(im)
+        return regions
 
-        # If multiple pages, stitch images together vertically
-        if len(images) > 1:
-            stitched = Image.new(
-                "RGB", (images[0].width, sum(im.height for im in images))
-            )
-            y_offset = 0
-            for im in images:
-                stitched.paste(im, (0, y_offset))
-                y_offset += im.height
-            return stitched
-        return images[0]
-
-    def extract_image_inpage(self, page: int, y0: int, y1: int, resolution=200):
-        page = self.pdf.pages[page]
+    def inpage_image_region(self, page: int, y0: int, y1: int) -> Region:
+        page_index = page
+        page = self.document.pages[page]
         # convert y0 y1 (from top) to y0 y1 (from bottom)
         y0 = page.height - y0
         y1 = page.height - y1
         if y1 > page.height - self.IGNORE_PAGE_FOOTER_Y:
             y1 = page.height - self.IGNORE_PAGE_FOOTER_Y
-        im = (
-            page.crop(
-                (
-                    self.QUESTION_START_X - 10,
-                    y0 - 20,
-                    page.width,
-                    y1 - 12,
-                )  # (x0, top, x1, bottom)
+        return (
+            page_index,
+            (
+                self.QUESTION_START_X - 10,
+                y0 - 20,
+                page.width,
+                y1 - 12,
+            ),  # (x0, top, x1, bottom)
+        )
+
+    def extract_question_image(
+        self,
+        start_page: int,
+        end_page: int,
+        resolution=200,
+        margin: int = 20,
+    ):
+        # If multiple pages, images are stitched together vertically
+        return self.document.render_regions(
+            self.question_image_regions(start_page, end_page, margin), resolution
+        )
+
+    def extract_image_inpage(self, page: int, y0: int, y1: int, resolution=200):
+        return self.document.render_regions(
+            [self.inpage_image_region(page, y0, y1)], resolution
+        )
+
+    def save_image(
+        self, regions: List[Region], name: str, resolution=200
+    ) -> Tuple[str, Optional[CropDescriptor]]:
+        # render now, or in text-only mode just describe the crop for later
+        image_path = self.image_sink.path(f"{self.IMAGE_PATH}{name}")
+        if not self.render_images:
+            return image_path, CropDescriptor(
+                self.document.path, regions, image_path, resolution
             )
-            .to_image(resolution=resolution)
-            .original
+        self.image_sink.submit(
+            self.document.render_regions(regions, resolution), image_path
         )
-        return im
+        return image_path, None
 
     def find_question_starts(self):
         # This method should be overridden in subclasses
@@ -0,0 +1,104 @@
+import numpy as np
+from typing import List, Optional
+from parser.chars import CharStore
+
+
+class Segment:
+    def __init__(self, level: int, number: int | str, start: int):
+        self.level = level  # 0 question, 1 subquestion, 2 subsubquestion
+        self.number = number
+        self.start = start  # char index range [start, end)
+        self.end = start
+        self.children: List["Segment"] = []
+        # page / y span, filled in when the segment is closed
+        self.start_page = self.end_page = 0
+        self.start_y = self.end_y = 0.0
+
+    def close(self, end: int, chars: CharStore):
+        self.end = end
+        self.start_page = int(chars.page[self.start])
+        self.end_page = int(chars.page[end - 1])
+        self.start_y = float(chars.y[self.start])
+        self.end_y = float(chars.y[end - 1])
+
+    def __repr__(self):
+        return (
+            f"Segment({self.number!r}, {self.start}:{self.end}"
+            + (f", {self.children!r}" if self.children else "")
+            + ")"
+        )
+
+
+def segment_questions(
+    chars: CharStore,
+    question_mask: np.ndarray,
+    subquestion_mask: np.ndarray,
+    subsubquestion_mask: np.ndarray,
+    roman_numerals: List[str],
+) -> List[Segment]:
+    """
+    Find question, subquestion and subsubquestion boundaries in one pass over
+    the chars that could start a marker: digits on the question anchor and
+    "(" on the subquestion or subsubquestion anchors. Markers must be the
+    next expected one: "1", "2"..., "(a)", "(b)"... and "(i)", "(ii)"... in
+    the order of `roman_numerals`.
+    """
+    text = chars.text
+    codes = chars.code
+    is_digit = (codes >= ord("0")) & (codes <= ord("9"))
+    is_paren = codes == ord("(")
+    candidates = np.flatnonzero(
+        (question_mask & is_digit)
+        | ((subquestion_mask | subsubquestion_mask) & is_paren)
+    )
+
+    questions: List[Segment] = []
+    question: Optional[Segment] = None
+    subquestion: Optional[Segment] = None
+    subsubquestion: Optional[Segment] = None
+    next_number = 1
+    next_alpha = "a"
+    next_roman = 0
+
+    def close_to(level: int, end: int):
+        # close every open segment at `level` or deeper
+        nonlocal question, subquestion, subsubquestion
+        if subsubquestion is not None:
+            subsubquestion.close(end, chars)
+            subsubquestion = None
+        if level <= 1 and subquestion is not None:
+            subquestion.close(end, chars)
+            subquestion = None
+        if level == 0 and question is not None:
+            question.close(end, chars)
+            question = None
+
+    for i in candidates.tolist():
+        if question_mask[i] and text.startswith(str(next_number), i):
+            close_to(0, i)
+            question = Segment(0, next_number, i)
+            questions.append(question)
+            next_number += 1
+            next_alpha = "a"
+            continue
+        if question is None or not is_paren[i]:
+            continue
+        if subquestion_mask[i] and text.startswith(f"({next_alpha})", i):
+            close_to(1, i)
+            subquestion = Segment(1, next_alpha, i)
+            question.children.append(subquestion)
+            next_alpha = chr(ord(next_alpha) + 1)
+            next_roman = 0
+            continue
+        if (
+            subquestion is not None
+            and subsubquestion_mask[i]
+            and next_roman < len(roman_numerals)
+            and text.startswith(f"({roman_numerals[next_roman]})", i)
+        ):
+            close_to(2, i)
+            subsubquestion = Segment(2, roman_numerals[next_roman], i)
+            subquestion.children.append(subsubquestion)
+            next_roman += 1
+    close_to(0, len(chars))
+    return questions
@@ -3,6 +3,9 @@ from pdf2docx import Converter
 from typing import List, Optional
 import re
 from parser.models.question import Question, SubQuestion, SubSubQuestion
+from parser.models.question_tree import QuestionTree
+from parser.image_sink import ImageSink
+from parser.models.crop import CropDescriptor
 
 
 class SQMSParser(Parser):
@@ -11,9 +14,17 @@ class SQMSParser(Parser):
         pdf_path: str,
         questions: List[Question],
         image_prefix: str = "example-",
+        image_sink: Optional[ImageSink] = None,
+        render_images: bool = True,
+        table_engine: str = "fitz",
+        workers: int = 1,
     ):
         self.questions = questions
-        super().__init__(pdf_path, image_prefix)
+        # path index over the questions, one lookup per mark scheme row
+        self.tree = QuestionTree(questions)
+        super().__init__(
+            pdf_path, image_prefix, image_sink, render_images, table_engine, workers
+        )
 
     def parse_ms(self):
         for ms in self.tables:
@@ -35,6 +46,7 @@ class SQMSParser(Parser):
                     image_path,
                     subquestion_number,
                     subsubquestion_number,
+                    ms.get("ImageCrop"),
                 )
             else:
                 print(f"Failed to match question format: {ms['Question']}")
@@ -49,53 +61,28 @@ class SQMSParser(Parser):
         image_path: str | List[str],
         subquestion_number: Optional[str] = None,
         subsubquestion_number: Optional[str] = None,
+        image_crop: Optional[CropDescriptor] = None,
     ):
-        # Find matching question
-        matching_question = next(
-            (q for q in self.questions if q.number == question_number), None
+        fields = dict(
+            answer=answer, marks=marks, ms_image=image_path, ms_image_crop=image_crop
         )
-        if not matching_question:
-            return
-
         # If no subquestion, assign directly to question
         if subquestion_number is None:
-            matching_question.answer = answer
-            matching_question.marks = marks
-            matching_question.ms_image = image_path
-            return
-
-        # Find matching subquestion
-        matching_subquestion = next(
-            (
-                sq
-                for sq in matching_question.subquestions
-                if sq.number == subquestion_number
-            ),
-            None,
-        )
-        if not matching_subquestion:
-            return
-
+            self.tree.assign((question_number,), **fields)
         # If no subsubquestion, assign to subquestion
-        if subsubquestion_number is None:
-            matching_subquestion.answer = answer
-            matching_subquestion.marks = marks
-            matching_subquestion.ms_image = image_path
-            return
-
-        # Find and assign to matching subsubquestion
-        matching_subsubquestion = next(
-            (
-                ssq
-                for ssq in matching_subquestion.subsubquestions
-                if ssq.number == subsubquestion_number
-            ),
-            None,
-        )
-        if matching_subsubquestion:
-            matching_subsubquestion.answer = answer
-            matching_subsubquestion.marks = marks
-            matching_subquestion.ms_image = image_path
+        elif subsubquestion_number is None:
+            self.tree.assign((question_number, subquestion_number), **fields)
+        # the mark scheme image of a subsubquestion row goes to its subquestion
+        elif self.tree.assign(
+            (question_number, subquestion_number, subsubquestion_number),
+            answer=answer,
+            marks=marks,
+        ):
+            self.tree.assign(
+                (question_number, subquestion_number),
+                ms_image=image_path,
+                ms_image_crop=image_crop,
+            )
 
     def complete_answers(self):
         # Complete subsubquestion answers first
@@ -1,6 +1,7 @@
 from parser.qp_parser import Parser
 from parser.models.question import Question, SubQuestion, SubSubQuestion
-import re
+from parser.segmenter import Segment, segment_questions
+from typing import List
 
 
 class QuestionPaperParser(Parser):
@@ -19,79 +20,66 @@ class QuestionPaperParser(Parser):
     QUESTION_START_X = 49.6063
     SUBQUESTION_START_X = 72
     SUBSUBQUESTION_STARTS = (90, 100)
+    LAYOUT_CONSTANTS = (
+        "QUESTION_START_X",
+        "SUBQUESTION_START_X",
+        "SUBSUBQUESTION_STARTS",
+    )
     question_parsing: int = 0
     subquestion_parsing: str = "z"
 
     def join_chars(self, start_index: int, end_index: int) -> str:
-        result = []
-        for i in range(start_index, end_index):
-            char = self.chars[i]
-            if i > start_index:
-                prev_char = self.chars[i - 1]
-                if abs(char["y"] - prev_char["y"]) > 1:
-                    result.append(" ")
-            result.append(char["text"])
-        return "".join(result)
+        # a space is inserted wherever y changes, i.e. at line breaks
+        return self.chars.text_index.join(start_index, end_index)
 
     def find_position_constants(self):
-        bold_chars = [char for char in self.chars if char["bold"]]
-        if len(bold_chars) == 0:
-            # from 2024 papers onwards, there is no font information
-            bold_chars = self.chars
-        bold_strings = "".join(char["text"] for char in bold_chars)
+        if self.load_layout_profile():
+            print(self.QUESTION_START_X)
+            return
+        found = self.find_first_bold(["1", "(a)", "(i)"])
         # find the first 1
-        first_one_index = bold_strings.index("1")
-        first_one_char = bold_chars[first_one_index]
-        self.QUESTION_START_X = first_one_char["x"]
+        if "1" not in found:
+            raise ValueError("question number 1 not found")
+        self.QUESTION_START_X = found["1"]
         print(self.QUESTION_START_X)
-        try:
-            # find the first (a)
-            first_a_index = bold_strings.index("(a)")
-            first_a_char = bold_chars[first_a_index]
-            self.SUBQUESTION_START_X = first_a_char["x"]
-            # find the first (i)
-            first_i_index = bold_strings.index("(i)")
-            first_i_char = bold_chars[first_i_index]
-            self.SUBSUBQUESTION_STARTS = (
-                first_i_char["x"] - 20,
-                first_i_char["x"] + 10,
-            )
-        except:
-            pass
+        # find the first (a) and (i)
+        if "(a)" in found:
+            self.SUBQUESTION_START_X = found["(a)"]
+            if "(i)" in found:
+                self.SUBSUBQUESTION_STARTS = (
+                    found["(i)"] - 20,
+                    found["(i)"] + 10,
+                )
+        self.save_layout_profile()
 
     def find_question_starts(self):
-        question_starts = []
-        current_number = 1
-        for i, char in enumerate(self.chars):
-            if abs(char["x"] - self.QUESTION_START_X) <= self.DIFFERENCE:
-                text = "".join(c["text"] for c in self.chars[i : i + 3])
-                if re.match(
-                    f"{current_number}",
-                    text,
-                ):
-                    question_starts.append(i)
-                    current_number += 1
-        return question_starts
+        return [question.start for question in self.segment()]
+
+    def segment(self) -> List[Segment]:
+        # question -> subquestion -> subsubquestion boundaries in one pass
+        return segment_questions(
+            self.chars,
+            self.chars.near_x_mask(self.QUESTION_START_X, self.DIFFERENCE),
+            self.chars.near_x_mask(self.SUBQUESTION_START_X, self.DIFFERENCE),
+            self.chars.between_x_mask(*self.SUBSUBQUESTION_STARTS),
+            self.ROMAN_NUMERALS,
+        )
+
+    def parse_question_paper(self):
+        questions = [self.parse_question(segment) for segment in self.segment()]
+        # wait for this paper's images to be written
+        self.image_sink.flush()
+        return questions
 
-    def parse_question(self, start_index: int, end_index: int, number: int):
-        start_page = self.chars[start_index]["page"]
-        end_page = self.chars[end_index - 1]["page"]
+    def parse_question(self, segment: Segment):
+        start_index, end_index, number = segment.start, segment.end, segment.number
         self.question_parsing = number
-        subquestion_starts = self.find_subquestion_starts(start_index, end_index)
-        if subquestion_starts:
+        if segment.children:
             subquestions = []
             image_paths = []  # List to store all subquestion image paths
-            question_text = self.join_chars(start_index, subquestion_starts[0])
-            for i, subquestion_start in enumerate(subquestion_starts):
-                if i == len(subquestion_starts) - 1:
-                    subquestion_end = end_index
-                else:
-                    subquestion_end = subquestion_starts[i + 1]
-                subquestion = self.parse_subquestion(
-                    subquestion_start,
-                    subquestion_end,
-                    chr(ord("a") + i),
-                )
+            question_text = self.join_chars(start_index, segment.children[0].start)
+            for subquestion_segment in segment.children:
+                subquestion = self.parse_subquestion(subquestion_segment)
                 subquestions.append(subquestion)
                 if isinstance(
                     subquestion.image, list
@@ -108,38 +96,29 @@ class QuestionPaperParser(Parser):
         else:
             subquestions = None
             question_text = self.join_chars(start_index, end_index)
-            image = self.extract_question_image(
-                start_page=start_page,
-                end_page=end_page,
+            # save image
+            image_path, image_crop = self.save_image(
+                self.question_image_regions(segment.start_page, segment.end_page),
+                f"{self.image_prefix}_question_{number}",
                 resolution=200,
             )
-            # save image
-            image_path = f"{self.IMAGE_PATH}{self.image_prefix}_question_{number}.png"
-            image.save(image_path)
             return Question(
                 number=number,
                 text=question_text,
                 subquestions=subquestions,
                 image=image_path,  # whole question image
+                image_crop=image_crop,
             )
 
-    def parse_subquestion(self, start_index: int, end_index: int, number: str):
-        subsubquestion_starts = self.find_subsubquestion_starts(start_index, end_index)
+    def parse_subquestion(self, segment: Segment):
+        start_index, end_index, number = segment.start, segment.end, segment.number
         self.subquestion_parsing = number
-        if subsubquestion_starts:
+        if segment.children:
             subsubquestions = []
             image_paths = []  # List to store subsubquestion image paths
-            subquestion_text = self.join_chars(start_index, subsubquestion_starts[0])
-            for i, subsubquestion_start in enumerate(subsubquestion_starts):
-                if i == len(subsubquestion_starts) - 1:
-                    subsubquestion_end = end_index
-                else:
-                    subsubquestion_end = subsubquestion_starts[i + 1]
-                subsubquestion = self.parse_subsubquestion(
-                    subsubquestion_start,
-                    subsubquestion_end,
-                    self.ROMAN_NUMERALS[i],
-                )
+            subquestion_text = self.join_chars(start_index, segment.children[0].start)
+            for subsubquestion_segment in segment.children:
+                subsubquestion = self.parse_subsubquestion(subsubquestion_segment)
                 subsubquestions.append(subsubquestion)
                 if subsubquestion.image:
                     image_paths.append(subsubquestion.image)
@@ -153,79 +132,49 @@ class QuestionPaperParser(Parser):
             subsubquestions = None
             subquestion_text = self.join_chars(start_index, end_index)
             # Extract image only if no subsubquestions
-            start_y = self.chars[start_index]["y"]
-            page = self.chars[start_index]["page"]
+            start_y = float(self.chars.y[start_index])
+            page = int(self.chars.page[start_index])
             end_y = (
-                self.chars[end_index + 1]["y"]
+                float(self.chars.y[end_index + 1])
                 if end_index < len(self.chars)
-                and self.chars[end_index + 1]["page"] == page
+                and self.chars.page[end_index + 1] == page
                 else self.IGNORE_PAGE_FOOTER_Y
             )
-            image = self.extract_image_inpage(
-                page=page,
-                y0=start_y,
-                y1=end_y,
+            image_path, image_crop = self.save_image(
+                [self.inpage_image_region(page=page, y0=start_y, y1=end_y)],
+                f"{self.image_prefix}_question{self.question_parsing}_sub_{number}",
                 resolution=200,
             )
-            image_path = f"{self.IMAGE_PATH}{self.image_prefix}_question{self.question_parsing}_sub_{number}.png"
-            image.save(image_path)
             return SubQuestion(
                 number=number,
                 text=subquestion_text,
                 subsubquestions=subsubquestions,
                 image=image_path,  # Single image path
+                image_crop=image_crop,
             )
 
-    def parse_subsubquestion(self, start_index: int, end_index: int, number: str):
+    def parse_subsubquestion(self, segment: Segment):
+        start_index, end_index, number = segment.start, segment.end, segment.number
         subsubquestion_text = self.join_chars(start_index, end_index)
         # Extract image for subsubquestion
-        start_y = self.chars[start_index]["y"]
-        page = self.chars[start_index]["page"]
+        start_y = float(self.chars.y[start_index])
+        page = int(self.chars.page[start_index])
         end_y = (
-            self.chars[end_index + 1]["y"]
-            if end_index < len(self.chars) and self.chars[end_index + 1]["page"] == page
+            float(self.chars.y[end_index + 1])
+            if end_index < len(self.chars) and self.chars.page[end_index + 1] == page
             else self.IGNORE_PAGE_FOOTER_Y
         )
-        image = self.extract_image_inpage(
-            page=page,
-            y0=start_y,
-            y1=end_y,
+        image_path, image_crop = self.save_image(
+            [self.inpage_image_region(page=page, y0=start_y, y1=end_y)],
+            f"{self.image_prefix}_question_{self.question_parsing}_sub_{self.subquestion_parsing}_subsub_{number}",
             resolution=200,
         )
-        image_path = f"{self.IMAGE_PATH}{self.image_prefix}_question_{self.question_parsing}_sub_{self.subquestion_parsing}_subsub_{number}.png"
-        image.save(image_path)
-        return SubSubQuestion(number=number, text=subsubquestion_text, image=image_path)
-
-    def find_subquestion_starts(self, start_index: int, end_index: int):
-        subquestion_starts = []
-        current_question_alpha = "a"
-        for i in range(start_index, end_index):
-            x = self.chars[i]["x"]
-            if abs(x - self.SUBQUESTION_START_X) <= self.DIFFERENCE:
-                text = "".join(char["text"] for char in self.chars[i : i + 5])
-                if re.match(r"\(" + current_question_alpha + r"\)", text):
-                    current_question_alpha = chr(ord(current_question_alpha) + 1)
-                    subquestion_starts.append(i)
-        return subquestion_starts
-
-    def find_subsubquestion_starts(self, start_index: int, end_index: int):
-        subsubquestion_starts = []
-        current_roman_index = 0
-        for i in range(start_index, end_index):
-            x = self.chars[i]["x"]
-            if (
-                self.SUBSUBQUESTION_STARTS[0]
-                <= round(x)
-                <= self.SUBSUBQUESTION_STARTS[1]
-            ):
-                text = "".join(char["text"] for char in self.chars[i : i + 5])
-                if re.match(
-                    r"\(" + self.ROMAN_NUMERALS[current_roman_index] + r"\)",
-                    text,
-                ):
-                    current_roman_index += 1
-                    subsubquestion_starts.append(i)
-        return subsubquestion_starts
+        return SubSubQuestion(
+            number=number,
+            text=subsubquestion_text,
+            image=image_path,
+            image_crop=image_crop,
+        )
 
 
 if __name__ == "__main__":
@@ -1,5 +1,9 @@
 from parser.models import Syllabus
+from parser.chars import CharStore
+from parser.document import PaperDocument
+from parser.glyph_cache import GlyphCache
 import pdfplumber
+import numpy as np
 from typing import Dict, List, Optional
 import re
 import pprint
@@ -13,42 +17,85 @@ class SyllabusParser:
     IGNORE_HEADER_Y = 760
     TITLE_PATTERN = r"(?<!\.)(\d+)\s*([A-Za-z\s]+)"
     SUBTITLE_PATTERN = r"\d+\.(\d+)\s*([A-Za-z\s]+)"
+    POINT_PATTERN = re.compile(r"\d+")
+    POINT_DIFFERENCE = 20
 
-    def __init__(self, pdf: pdfplumber.PDF, pages: Optional[tuple] = None):
-        self.pdf = pdf
+    def __init__(
+        self,
+        pdf: pdfplumber.PDF | PaperDocument,
+        pages: Optional[tuple] = None,
+        glyph_cache: Optional[GlyphCache] = None,
+    ):
+        self.document = pdf if isinstance(pdf, PaperDocument) else PaperDocument(pdf)
+        self.pdf = self.document.pdf
         self.PAGES = pages if pages else self.PAGES
+        self.glyph_cache = glyph_cache
         self.chars = self.read_texts()
+        self.build_index()
 
-    def read_texts(self):
-        chars = []
-        for i, page in enumerate(self.pdf.pages[self.PAGES[0] - 1 : self.PAGES[1]]):
-            if re.search(r"BLANK PAGE", page.extract_text()):
-                continue
-            page_chars = page.chars
-            page_chars = list(
-                filter(
-                    lambda x: self.IGNORE_HEADER_Y
-                    > x["y0"]
-                    > (self.IGNORE_PAGE_FOOTER_Y)
-                    and len(x["text"]) == 1,
-                    page_chars,
-                )
+    def read_texts(self) -> CharStore:
+        if self.glyph_cache is not None and self.document.path:
+            return self.glyph_cache.get_or_read(
+                self.document.path, self.glyph_cache_params(), self.extract_texts
             )
-            chars.extend(
-                [
-                    {
-                        "index": len(chars) + j,
-                        "x": char["x0"],
-                        "y": char["y0"],
-                        "text": char["text"],
-                        "bold": "bold" in char["fontname"].lower(),
-                        "page": i + 1,
-                    }
-                    for j, char in enumerate(page_chars)
+        return self.extract_texts()
+
+    def glyph_cache_params(self) -> tuple:
+        return (
+            "syllabus",
+            self.document.char_source.name,
+            tuple(self.PAGES),
+            self.IGNORE_PAGE_FOOTER_Y,
+            self.IGNORE_HEADER_Y,
+        )
+
+    @classmethod
+    def snapshot_params(cls, char_source: str) -> tuple:
+        # everything besides the PDF and page range that shapes parse_syllabus
+        return (
+            char_source,
+            cls.IGNORE_PAGE_FOOTER_Y,
+            cls.IGNORE_HEADER_Y,
+            cls.CORE_START_X,
+            cls.SUPPLEMENT_START_X,
+            cls.POINT_DIFFERENCE,
+            cls.TITLE_PATTERN,
+            cls.SUBTITLE_PATTERN,
+            cls.POINT_PATTERN.pattern,
+        )
+
+    def extract_texts(self) -> CharStore:
+        pages = []
+        for i, page_index in enumerate(
+            range(self.PAGES[0] - 1, min(self.PAGES[1], len(self.document)))
+        ):
+            if self.document.is_blank(page_index):
+                continue
+            page_chars = self.document.read_page(page_index, page=i + 1)
+            pages.append(
+                page_chars[
+                    (self.IGNORE_HEADER_Y > page_chars.y)
+                    & (page_chars.y > self.IGNORE_PAGE_FOOTER_Y)
                 ]
             )
+        return CharStore.concatenate(pages)
 
-        return chars
+    def build_index(self):
+        # bold-only text of the whole syllabus, with the char index of each
+        # of its positions, for the title and subtitle patterns
+        self.bolds = np.flatnonzero(self.chars.bold)
+        self.bold_text = CharStore.decode(self.chars.code[self.bolds])
+        # point numbers: digits starting near either column
+        x = self.chars.x
+        code = self.chars.code
+        self.point_candidates = np.flatnonzero(
+            (
+                (np.abs(x - self.CORE_START_X) < self.POINT_DIFFERENCE)
+                | (np.abs(x - self.SUPPLEMENT_START_X) < self.POINT_DIFFERENCE)
+            )
+            & (code >= ord("0"))
+            & (code <= ord("9"))
+        )
 
     def parse_syllabus(self):
         syllabuses = []
@@ -79,27 +126,21 @@ class SyllabusParser:
         return syllabuses
 
     def parse_syllabus_from_subtitle(self, start: int, end: int) -> Optional[Syllabus]:
-        title = ""
-        for char in self.chars[start:end]:
-            if char["bold"]:
-                title += char["text"]
-            else:
-                break
+        # the title runs up to the first non-bold char
+        not_bold = np.flatnonzero(~self.chars.bold[start:end])
+        title = self.chars.text[
+            start : start + (int(not_bold[0]) if len(not_bold) else end - start)
+        ]
         number = re.search(r"\d+.\d+", title).group(0)
         syllabus = Syllabus(number=number, title=title, content=[])
         # parse content
         point_starts = self.find_point_starts(start, end)
         for i, point_start in enumerate(point_starts):
-            raw_content = "".join(
-                [
-                    char["text"]
-                    for char in self.chars[
-                        (point_start + 2) : (
-                            point_starts[i + 1] if i < len(point_starts) - 1 else end
-                        )
-                    ]
-                ]
-            )
+            raw_content = self.chars.text[
+                (point_start + 2) : (
+                    point_starts[i + 1] if i < len(point_starts) - 1 else end
+                )
+            ]
 
             splited = list(
                 filter(lambda x: len(x) > 3, re.split(r"\(\w+\)", raw_content))
@@ -108,42 +149,40 @@ class SyllabusParser:
         return syllabus
 
     def find_title_starts(self) -> List[int]:
-        title_starts = []
-        title_number = 1
-        bolds = [char for char in filter(lambda x: x["bold"], self.chars)]
-        bolds_text = "".join(bold["text"] for bold in bolds)
-        for match in re.finditer(self.TITLE_PATTERN, bolds_text):
-            if match.group(1) == str(title_number):
-                title_starts.append(bolds[match.start()]["index"])
-                title_number += 1
-        return title_starts
+        return self.find_bold_markers(self.TITLE_PATTERN, 0, len(self.chars))
 
     def find_subtitle_starts(self, start: int, end: int) -> List[int]:
-        subtitle_starts = []
-        subtitle_number = 1
-        bolds_in_range = [char for char in self.chars[start:end] if char["bold"]]
-        bold_texts = "".join(bold["text"] for bold in bolds_in_range)
-        for i, match in enumerate(re.finditer(self.SUBTITLE_PATTERN, bold_texts)):
-            if match and match.group(1) == str(subtitle_number):
-                subtitle_starts.append(bolds_in_range[match.start()]["index"])
-                subtitle_number += 1
-        return subtitle_starts
+        return self.find_bold_markers(self.SUBTITLE_PATTERN, start, end)
+
+    def find_bold_markers(self, pattern: str, start: int, end: int) -> List[int]:
+        # markers numbered 1, 2, 3... among the bold chars in [start, end);
+        # pos/endpos scan the prebuilt bold text as a slice of it would
+        starts = []
+        number = 1
+        for match in re.compile(pattern).finditer(
+            self.bold_text,
+            int(np.searchsorted(self.bolds, start)),
+            int(np.searchsorted(self.bolds, end)),
+        ):
+            if match.group(1) == str(number):
+                starts.append(int(self.bolds[match.start()]))
+                number += 1
+        return starts
 
     def find_point_starts(self, start: int, end: int) -> List[int]:
         point_starts = []
         current_point = 1
-        for i in range(start, end):
-            # if the char within 20 pixels of the CORE_START_X or SUPPLEMENT_START_X, and it is a number, check for it
-            if (
-                abs(self.chars[i]["x"] - self.CORE_START_X) < 20
-                or abs(self.chars[i]["x"] - self.SUPPLEMENT_START_X) < 20
-            ):
-                match = re.match(
-                    r"\d+", "".join([char["text"] for char in self.chars[i : i + 2]])
-                )
-                if match and match.group(0) == str(current_point):
-                    point_starts.append(i)
-                    current_point += 1
+        candidates = self.point_candidates[
+            np.searchsorted(self.point_candidates, start) : np.searchsorted(
+                self.point_candidates, end
+            )
+        ]
+        for i in candidates:
+            # the number is read from at most two chars, as before
+            match = self.POINT_PATTERN.match(self.chars.text, i, i + 2)
+            if match.group(0) == str(current_point):
+                point_starts.append(int(i))
+                current_point += 1
         return point_starts
 
 
@@ -0,0 +1,120 @@
+import os
+import sys
+import fitz
+import pytest
+
+# the packages are imported from the repository root, as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WIDTH, HEIGHT = 595.28, 841.89
+
+
+def write_text(page, x: float, y: float, text: str, bold: bool = False, size=11):
+    page.insert_text((x, y), text, fontname="hebo" if bold else "helv", fontsize=size)
+
+
+def structured_paper(path: str):
+    # a cover and four pages of numbered questions with (a) and (i) parts
+    doc = fitz.open()
+    write_text(doc.new_page(width=WIDTH, height=HEIGHT), 100, 100, "Biology Paper 4")
+    number = 1
+    for page_number in range(4):
+        page = doc.new_page(width=WIDTH, height=HEIGHT)
+        y = 80
+        for _ in range(2):
+            write_text(page, 49.6063, y, str(number), bold=True)
+            write_text(page, 65, y, f"This is question {number} stem text.")
+            y += 20
+            if number % 3:
+                for letter in "abc"[: 1 + number % 3]:
+                    write_text(page, 72, y, f"({letter})", bold=True)
+                    write_text(page, 90, y, f"Part {letter} of question {number}")
+                    y += 14
+                    write_text(page, 90, y, "continued second line ...... [2]")
+                    y += 18
+                    if letter == "b":
+                        for numeral in ("i", "ii"):
+                            write_text(page, 95, y, f"({numeral})", bold=True)
+                            write_text(page, 115, y, f"Roman {numeral} text [1]")
+                            y += 18
+            else:
+                write_text(page, 65, y, "A question without parts ........ [3]")
+                y += 20
+            number += 1
+        write_text(page, 290, 51.4, str(page_number + 2))
+        write_text(page, 60, HEIGHT - 20, "(c) UCLES footer", size=7)
+    doc.save(path)
+    doc.close()
+
+
+def multiple_choice_paper(path: str):
+    doc = fitz.open()
+    write_text(doc.new_page(width=WIDTH, height=HEIGHT), 100, 100, "Multiple Choice")
+    number = 1
+    for _ in range(3):
+        page = doc.new_page(width=WIDTH, height=HEIGHT)
+        y = 80
+        for _ in range(3):
+            write_text(page, 49.6063, y, str(number), bold=True)
+            write_text(page, 65, y, f"Which statement {number} is correct?")
+            y += 18
+            for option in "ABCD":
+                write_text(page, 70, y, option, bold=True)
+                write_text(page, 85, y, f"option {option.lower()} for {number}")
+                y += 14
+            y += 12
+            number += 1
+        write_text(page, 60, HEIGHT - 20, "(c) UCLES footer", size=7)
+    doc.save(path)
+    doc.close()
+
+
+@pytest.fixture(scope="session")
+def sample_papers(tmp_path_factory) -> list:
+    directory = tmp_path_factory.mktemp("papers")
+    paths = [
+        str(directory / "0610_s20_qp_41.pdf"),
+        str(directory / "0610_s20_qp_11.pdf"),
+    ]
+    structured_paper(paths[0])
+    multiple_choice_paper(paths[1])
+    return paths
+
+
+@pytest.fixture
+def stub_server():
+    from classify.stub_server import start_stub_server
+
+    server = start_stub_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def syllabuses() -> list:
+    from parser.models.syllabus import Syllabus
+
+    return [
+        Syllabus(number=f"{i}.{j}", title=f"{i}.{j} Topic", content=["point"])
+        for i in range(1, 6)
+        for j in range(1, 4)
+    ]
+
+
+def multiple_choice_papers(count: int, questions: int = 10) -> list:
+    from parser.models.question import MultipleChoiceQuestion
+
+    return [
+        [
+            MultipleChoiceQuestion(
+                number=n, text=f"Paper {p} question {n}", options=["A a", "B b"]
+            )
+            for n in range(1, questions + 1)
+        ]
+        for p in range(count)
+    ]
+
+
+def tags(questions: list) -> list:
+    return [[syllabus.number for syllabus in q.syllabus] for q in questions]
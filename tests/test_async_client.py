@@ -0,0 +1,96 @@
+import asyncio
+import copy
+import time
+from classify.async_client import AsyncChatClient, ClassifierPool, TokenRateLimiter
+from classify.classify_llm import LLMClassifier
+from conftest import multiple_choice_papers, tags
+
+
+def request(text: str = "hello") -> dict:
+    return {"model": "stub", "messages": [{"role": "user", "content": text}]}
+
+
+def client_for(server, **options) -> AsyncChatClient:
+    return AsyncChatClient(
+        "key", f"http://127.0.0.1:{server.server_port}", backoff=0.01, **options
+    )
+
+
+def test_throttled_requests_are_retried(stub_server):
+    stub_server.fail_rate = 0.5
+
+    async def run() -> list:
+        async with client_for(stub_server, concurrency=4, max_retries=20) as client:
+            return await asyncio.gather(
+                *(client.complete(request()) for _ in range(20))
+            )
+
+    results = asyncio.run(run())
+    assert all(result is not None for result in results)
+    assert stub_server.failures > 0
+    assert stub_server.requests == 20 + stub_server.failures
+
+
+def test_client_gives_up_after_max_retries(stub_server):
+    stub_server.fail_rate = 1.0
+
+    async def run():
+        async with client_for(stub_server, max_retries=2) as client:
+            return await client.complete(request())
+
+    assert asyncio.run(run()) is None
+    assert stub_server.requests == 3
+
+
+def test_retry_delay_backs_off_exponentially_with_jitter():
+    client = AsyncChatClient("key", "http://unused", backoff=1.0, max_backoff=10.0)
+    for attempt in range(6):
+        delay = client.retry_delay(attempt, None)
+        limit = min(2**attempt, 10.0)
+        assert limit / 2 <= delay <= limit
+    # Retry-After wins over the backoff, within max_backoff
+    assert client.retry_delay(0, "3") == 3.0
+    assert client.retry_delay(0, "120") == 10.0
+    assert 0.5 <= client.retry_delay(0, "soon") <= 1.0
+
+
+def test_rate_limiter_does_not_block_requests_that_fit():
+    limiter = TokenRateLimiter(tokens_per_minute=100)
+    limiter.WINDOW = 0.3
+    finished = {}
+
+    async def acquire(name: str, tokens: int, delay: float = 0.0):
+        await asyncio.sleep(delay)
+        await limiter.acquire(tokens)
+        finished[name] = time.monotonic()
+
+    async def run():
+        await limiter.acquire(80)
+        start = time.monotonic()
+        # "big" has to wait for the window, "small" still fits beside it
+        await asyncio.gather(acquire("big", 50), acquire("small", 10, delay=0.01))
+        return start
+
+    start = asyncio.run(run())
+    assert finished["small"] - start < 0.1
+    assert finished["big"] - start >= 0.25
+
+
+def test_pool_returns_papers_in_order(stub_server, syllabuses):
+    papers = multiple_choice_papers(12)
+    api_url = f"http://127.0.0.1:{stub_server.server_port}"
+    classifier = LLMClassifier("key", api_url, syllabuses)
+    expected = [tags(classifier.classify_all(copy.deepcopy(paper))) for paper in papers]
+    # several papers share packed requests, so their answers differ from
+    # classify_all's
+    expected_many = [
+        tags(paper) for paper in classifier.classify_many(copy.deepcopy(papers))
+    ]
+
+    stub_server.fail_rate = 0.3
+    with ClassifierPool(classifier, concurrency=6, backoff=0.01) as pool:
+        single = [pool.submit(copy.deepcopy(paper)) for paper in papers]
+        many = pool.submit_many([copy.deepcopy(paper) for paper in papers])
+        assert [tags(future.result()) for future in single] == expected
+        assert [tags(paper) for paper in many.result()] == expected_many
+    assert stub_server.failures > 0
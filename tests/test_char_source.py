@@ -0,0 +1,56 @@
+import pytest
+from parser.char_source import CHAR_SOURCES
+from parser.document import PaperDocument
+from parser.mcq_parser import MCQParser
+from parser.sq_parser import QuestionPaperParser
+
+
+def question_tree(questions) -> list:
+    # number and text of every question, subquestion and subsubquestion
+    return [
+        (
+            question.number,
+            question.text,
+            question_tree(
+                getattr(question, "subquestions", None)
+                or getattr(question, "subsubquestions", None)
+                or []
+            ),
+        )
+        for question in questions
+    ]
+
+
+def parse(path: str, char_source: str) -> list:
+    with PaperDocument.open(path, char_source=char_source) as document:
+        parser_class = (
+            MCQParser if document.is_multiple_choice() else QuestionPaperParser
+        )
+        parser = parser_class(
+            document,
+            image_prefix="paper",
+            render_images=False,
+        )
+        return question_tree(parser.parse_question_paper())
+
+
+@pytest.mark.parametrize("paper", [0, 1], ids=["structured", "multiple-choice"])
+def test_char_sources_parse_the_same_questions(sample_papers, paper):
+    trees = {name: parse(sample_papers[paper], name) for name in CHAR_SOURCES}
+    assert trees["pdfplumber"]
+    assert trees["pymupdf"] == trees["pdfplumber"]
+
+
+def test_pymupdf_pages_are_extracted_once(sample_papers):
+    with PaperDocument.open(sample_papers[0], char_source="pymupdf") as document:
+        source = document.char_source
+        calls = []
+        extract_page = source.extract_page
+        source.extract_page = lambda index: calls.append(index) or extract_page(index)
+        document.is_multiple_choice()
+        text = document.page_text(1)
+        chars = document.read_page(1, page=5)
+        assert calls == [0, 1]
+        assert chars.text == text
+        assert set(chars.page.tolist()) == {5}
+        assert document.read_page(1) is source.page_chars(1)
@@ -0,0 +1,21 @@
+from parser.layout_profile import LayoutProfileCache
+
+
+def test_workers_keep_each_others_profiles(tmp_path):
+    cache_dir = str(tmp_path / "profiles")
+    first, second = LayoutProfileCache(cache_dir), LayoutProfileCache(cache_dir)
+    first.put("sq:0610_s20_qp_3x", {"QUESTION_START_X": 49.6})
+    second.put("sq:0610_w21_qp_4x", {"QUESTION_START_X": 51.0})
+    fresh = LayoutProfileCache(cache_dir)
+    assert fresh.get("sq:0610_s20_qp_3x") == {"QUESTION_START_X": 49.6}
+    assert fresh.get("sq:0610_w21_qp_4x") == {"QUESTION_START_X": 51.0}
+
+
+def test_profiles_of_older_versions_are_dropped(tmp_path):
+    cache = LayoutProfileCache(str(tmp_path))
+    cache.put("sq:0610_s20_qp_3x", {"QUESTION_START_X": 49.6})
+    LayoutProfileCache.VERSION += 1
+    try:
+        assert LayoutProfileCache(str(tmp_path)).get("sq:0610_s20_qp_3x") is None
+    finally:
+        LayoutProfileCache.VERSION -= 1
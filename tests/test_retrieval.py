@@ -0,0 +1,49 @@
+from classify.retrieval import SyllabusRetriever
+from parser.models.syllabus import Syllabus
+
+TOPICS = [
+    ("1.1", "Enzymes", ["enzymes are proteins that act as biological catalysts"]),
+    ("1.2", "Photosynthesis", ["chlorophyll absorbs light energy in leaves"]),
+    ("1.3", "Respiration", ["aerobic respiration releases energy from glucose"]),
+    ("2.1", "Diffusion", ["net movement of particles down a concentration gradient"]),
+    ("2.2", "Osmosis", ["water moves through a partially permeable membrane"]),
+    ("3.1", "Inheritance", ["alleles of a gene on chromosomes"]),
+]
+
+
+def retriever(**options) -> SyllabusRetriever:
+    syllabuses = [
+        Syllabus(number=number, title=f"{number} {title}", content=content)
+        for number, title, content in TOPICS
+    ]
+    return SyllabusRetriever(syllabuses, **options)
+
+
+def numbers(candidates) -> list:
+    return [syllabus.number for syllabus in candidates]
+
+
+def test_candidates_are_each_questions_top_items():
+    candidates = retriever(top_k=1).candidates(
+        ["Which enzymes act as catalysts?", "Explain osmosis across a membrane."]
+    )
+    assert numbers(candidates) == ["1.1", "2.2"]
+
+
+def test_weak_question_widens_only_its_own_candidates():
+    texts = ["Which enzymes act as catalysts?", "Complete the table of energy."]
+    scorer = retriever(top_k=1)
+    weak = scorer.scores(texts[1:]).max()
+    assert 0 < weak
+    candidates = retriever(top_k=1, min_score=weak + 0.01, wide_k=2).candidates(texts)
+    assert candidates is not None
+    assert "1.1" in numbers(candidates)
+    assert len(candidates) == 3
+
+
+def test_question_without_syllabus_words_sends_full_syllabus():
+    scorer = retriever(top_k=1)
+    texts = ["Which enzymes act as catalysts?", "Complete the table."]
+    assert scorer.candidates(texts) is None
+    assert scorer.candidates(["Complete the table."]) is None
+    assert numbers(scorer.candidates(texts[:1])) == ["1.1"]
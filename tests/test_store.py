@@ -0,0 +1,20 @@
+from db.store import SyllabusStore
+from parser.syllabus_parser import SyllabusParser
+
+
+def test_snapshot_key_changes_with_char_source_and_thresholds(
+    sample_papers, monkeypatch
+):
+    store = SyllabusStore(collection=None)
+    pdf, pages = sample_papers[0], (1, 2)
+    key = store.snapshot_key(pdf, pages, SyllabusParser.snapshot_params("pdfplumber"))
+    assert key == store.snapshot_key(
+        pdf, pages, SyllabusParser.snapshot_params("pdfplumber")
+    )
+    assert key != store.snapshot_key(
+        pdf, pages, SyllabusParser.snapshot_params("pymupdf")
+    )
+    monkeypatch.setattr(SyllabusParser, "CORE_START_X", 70)
+    assert key != store.snapshot_key(
+        pdf, pages, SyllabusParser.snapshot_params("pdfplumber")
+    )